@@ -1,19 +1,30 @@
+import asyncio
+import inspect
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
 from http import HTTPStatus
 from pathlib import Path
-from typing import Dict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-import pandas as pd
-import uvicorn
+import numpy as np
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.types import Receive, Scope, Send
 
-from backend.schemas import RunningPack
+import runsor.artifacts
+from backend import metrics
+from backend.batching import MicroBatcher
+from backend.capture import RequestCapture
+from backend.reload import ModelReloader
+from backend.schemas import COLUMNS, Run, RunningPack, runs_to_array
 from config import config
 from config.config import logger
-from runsor import main, predict
+from runsor import predict
 
 # Define application
 app = FastAPI(
@@ -21,33 +32,157 @@ app = FastAPI(
     description="Regressor machine learning project.",
     version=0.1,
 )
+app.add_middleware(metrics.MetricsMiddleware)
+# Micro-batcher of concurrent predictions, created at startup
+batcher = None
+# Artifacts and batcher are replaced together when a new run is promoted
+_swap_lock = threading.Lock()
+reloader = None
+# Threads running the model for the async route and the number of free slots, created at startup
+executor = None
+slots = None
+# Writer of sampled prediction requests, created at startup when capture is enabled
+capture = None
+
+
+def _load_serving_artifacts(run_id: str) -> Dict:
+    """Artifacts of a run, a bundled model must predict the features of the request schema."""
+    return runsor.artifacts.load_serving_artifacts(run_id, features=COLUMNS)
 
 
 @app.on_event("startup")
 def load_artifacts():
     global artifacts
-    run_id = open(Path(config.CONFIG_DIR, "run_id.txt")).read()
-    artifacts = main.load_artifacts(run_id=run_id)
+    config.init()
+    run_id = open(Path(config.CONFIG_DIR, "run_id.txt")).read().strip()
+    artifacts = _load_serving_artifacts(run_id)
     logger.info("Ready for inference!")
 
 
+def _create_batcher(artifacts: Dict) -> Optional[MicroBatcher]:
+    """Micro-batcher bound to the model of the artifacts, None when batching is disabled."""
+    if not config.MICRO_BATCHING:
+        return None
+    return MicroBatcher(
+        metrics.timed("model_predict", artifacts["model"].predict),
+        max_batch=config.BATCH_MAX_SIZE,
+        max_wait=config.BATCH_MAX_WAIT,
+        timeout=config.BATCH_TIMEOUT,
+    ).start()
+
+
+@app.on_event("startup")
+def start_batcher():
+    global batcher
+    batcher = _create_batcher(artifacts)
+
+
+@app.on_event("shutdown")
+def stop_batcher():
+    if batcher is not None:
+        batcher.stop()
+
+
+def _serving() -> Tuple[Dict, Optional[MicroBatcher]]:
+    """Artifacts and batcher of the run served now, a request uses them until it finishes."""
+    with _swap_lock:
+        return artifacts, batcher
+
+
+def swap_artifacts(new_artifacts: Dict) -> None:
+    """Serve new artifacts, requests already running finish on the previous model."""
+    global artifacts, batcher
+    new_batcher = _create_batcher(new_artifacts)
+    with _swap_lock:
+        old_batcher = batcher
+        artifacts, batcher = new_artifacts, new_batcher
+    if old_batcher is not None:
+        # Requests queued in the previous batcher are still predicted before it stops
+        timer = threading.Timer(config.RELOAD_GRACE_PERIOD, old_batcher.stop)
+        timer.daemon = True
+        timer.start()
+
+
+@app.on_event("startup")
+def start_reloader():
+    global reloader
+    if config.HOT_RELOAD:
+        reloader = ModelReloader(
+            Path(config.CONFIG_DIR, "run_id.txt"),
+            load_fn=_load_serving_artifacts,
+            swap_fn=swap_artifacts,
+            run_id=artifacts.get("run_id"),
+            interval=config.RELOAD_INTERVAL,
+        ).start()
+
+
+@app.on_event("shutdown")
+def stop_reloader():
+    if reloader is not None:
+        reloader.stop()
+
+
+@app.on_event("startup")
+def start_executor():
+    global executor, slots
+    executor = ThreadPoolExecutor(max_workers=config.PREDICT_WORKERS, thread_name_prefix="predict")
+    slots = asyncio.Semaphore(config.PREDICT_QUEUE_SIZE)
+
+
+@app.on_event("shutdown")
+def stop_executor():
+    if executor is not None:
+        executor.shutdown()
+
+
+@app.on_event("startup")
+def start_capture():
+    global capture
+    if config.REQUEST_CAPTURE:
+        capture = RequestCapture(
+            config.CAPTURE_FP,
+            sample_rate=config.CAPTURE_SAMPLE_RATE,
+            max_queue=config.CAPTURE_QUEUE_SIZE,
+            max_bytes=config.CAPTURE_MAX_BYTES,
+        ).start()
+
+
+@app.on_event("shutdown")
+def stop_capture():
+    global capture
+    if capture is not None:
+        capture.stop()
+        capture = None
+
+
 # Decorator
 def create_response(f):
     """Create a JSON response for an endpoint."""
 
+    def build(request: Request, results: Dict) -> Dict:
+        with metrics.stage("create_response"):
+            response = {
+                "message": results["message"],
+                "method": request.method,
+                "status-code": results["status-code"],
+                "timestamp": datetime.now().isoformat(),
+                "url": request.url._url,
+            }
+            if "data" in results:
+                response["data"] = results["data"]
+        return response
+
+    if inspect.iscoroutinefunction(f):
+
+        @wraps(f)
+        async def async_wrapper(request: Request, *args, **kwargs) -> Dict:
+            return build(request, await f(request, *args, **kwargs))
+
+        return async_wrapper
+
     @wraps(f)
     def wrapper(request: Request, *args, **kwargs) -> Dict:
-        results = f(request, *args, **kwargs)
-        response = {
-            "message": results["message"],
-            "method": request.method,
-            "status-code": results["status-code"],
-            "timestamp": datetime.now().isoformat(),
-            "url": request.url._url,
-        }
-        if "data" in results:
-            response["data"] = results["data"]
-        return response
+        return build(request, f(request, *args, **kwargs))
 
     return wrapper
 
@@ -104,20 +239,221 @@ def _arg(request: Request, arg: str) -> Dict:
     return response
 
 
+@app.get("/batching", tags=["Performance"])
+@create_response
+def _batching(request: Request) -> Dict:
+    """Get batch size and queueing delay statistics of the micro-batcher."""
+    response = {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": {"batching": batcher.metrics() if batcher is not None else {}},
+    }
+    return response
+
+
+@app.get("/cache", tags=["Performance"])
+@create_response
+def _cache(request: Request) -> Dict:
+    """Get hit ratio and size of the prediction cache."""
+    response = {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": {"prediction_cache": predict.PREDICTION_CACHE.info()},
+    }
+    return response
+
+
+@app.get("/metrics", tags=["Performance"], response_class=PlainTextResponse)
+def _metrics() -> str:
+    """Get latency histograms and counters in Prometheus text format."""
+    current, current_batcher = _serving()
+    cache = predict.PREDICTION_CACHE.info()
+    extra = metrics.gauge(
+        "runsor_serving_run_info", "Run serving predictions", 1, {"run_id": current.get("run_id")}
+    )
+    for key in ["hits", "misses", "size"]:
+        extra += metrics.gauge(
+            f"runsor_prediction_cache_{key}", f"Prediction cache {key}", cache[key]
+        )
+    if current_batcher is not None:
+        extra += metrics.batching_metrics(current_batcher.metrics())
+    if capture is not None:
+        for key, value in capture.metrics().items():
+            extra += metrics.gauge(
+                f"runsor_captured_requests_{key}", f"Captured prediction requests {key}", value
+            )
+    return metrics.render(extra)
+
+
 @app.post("/predict", tags=["Prediction"])
 @create_response
 def predictValue(request: Request, run_pack: RunningPack) -> Dict:
-    # Convert list of Run objects into json format
-    runs_json = json.loads(run_pack.json())
-    df = pd.json_normalize(runs_json, "runs")
-    predictions = predict.predict(df, artifacts=artifacts)
+    metrics.observe_parsing(request.state)
+    if capture is not None:
+        capture.capture("/predict", run_pack)
+    current, current_batcher = _serving()
+    with metrics.stage("to_array"):
+        values = run_pack.to_array()
+    # Concurrent requests share a single model call
+    if current_batcher is not None:
+        predict_fn = current_batcher.predict
+    else:
+        predict_fn = metrics.timed("model_predict", current["model"].predict)
+    with metrics.stage("predict"):
+        calories = predict.predict_values(values, current, predict_fn)
+    with metrics.stage("format_predictions"):
+        predictions = predict.format_predictions(values, calories)
+    metrics.PREDICTED_RUNS.inc(len(values), route="/predict")
+    response = {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": {"predictions": predictions, "run_id": current.get("run_id")},
+    }
+    return response
+
+
+async def _predict_model(
+    values: np.ndarray, current: Dict, current_batcher: Optional[MicroBatcher]
+) -> np.ndarray:
+    """Run the model on feature rows off the event loop."""
+    # Bounded number of predictions in flight, the event loop keeps accepting connections
+    async with slots:
+        if current_batcher is not None:
+            return await asyncio.wrap_future(current_batcher.submit(values))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, metrics.timed("model_predict", current["model"].predict), values
+        )
+
+
+async def _predict_async(
+    values: np.ndarray,
+    current: Dict,
+    current_batcher: Optional[MicroBatcher],
+    use_cache: bool = True,
+) -> np.ndarray:
+    """Predict feature rows off the event loop, evaluating the model only for runs not cached."""
+    scope = predict.cache_scope(current) if use_cache and predict.cacheable(values) else None
+    if scope is None:
+        return await _predict_model(values, current, current_batcher)
+    calories, missing = predict.cached_predictions(values, scope)
+    if missing:
+        predicted = await _predict_model(values[missing], current, current_batcher)
+        calories[missing] = predicted
+        predict.cache_predictions(values[missing], predicted, scope)
+    return calories
+
+
+@app.post("/predict/async", tags=["Prediction"])
+@create_response
+async def predictValueAsync(request: Request, run_pack: RunningPack) -> Dict:
+    """Predict like /predict, running the model off the event loop."""
+    metrics.observe_parsing(request.state)
+    if capture is not None:
+        capture.capture("/predict/async", run_pack)
+    current, current_batcher = _serving()
+    with metrics.stage("to_array"):
+        values = run_pack.to_array()
+    with metrics.stage("predict"):
+        calories = await _predict_async(values, current, current_batcher)
+    with metrics.stage("format_predictions"):
+        predictions = predict.format_predictions(values, calories)
+    metrics.PREDICTED_RUNS.inc(len(values), route="/predict/async")
     response = {
         "message": HTTPStatus.OK.phrase,
         "status-code": HTTPStatus.OK,
-        "data": {"predictions": predictions},
+        "data": {"predictions": predictions, "run_id": current.get("run_id")},
     }
     return response
 
 
+class NDJSONResponse(StreamingResponse):
+    """
+    Stream of newline-delimited JSON produced while the request body is still being read.
+    StreamingResponse listens for a client disconnect by reading request messages, which would
+    take the body chunks away from the generator, so only the response is streamed here.
+    """
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def _ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    """Split the streamed request body into lines, holding at most one partial line."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > config.BULK_MAX_LINE_BYTES:
+            raise ValueError(f"Line longer than {config.BULK_MAX_LINE_BYTES} bytes")
+    if buffer:
+        yield buffer
+
+
+async def _predict_chunk(
+    runs: List[Run], current: Dict, current_batcher: Optional[MicroBatcher]
+) -> str:
+    """Predict a chunk of runs and serialize the predictions as NDJSON."""
+    with metrics.stage("to_array"):
+        values = runs_to_array(runs)
+    with metrics.stage("predict"):
+        # Bulk runs are rarely repeated, caching them would evict the single runs
+        calories = await _predict_async(values, current, current_batcher, use_cache=False)
+    with metrics.stage("format_predictions"):
+        predictions = predict.format_predictions(values, calories)
+    metrics.PREDICTED_RUNS.inc(len(values), route="/predict/bulk")
+    return "".join(json.dumps(prediction) + "\n" for prediction in predictions)
+
+
+async def _bulk_predictions(
+    request: Request, current: Dict, current_batcher: Optional[MicroBatcher]
+) -> AsyncIterator[str]:
+    """Predict NDJSON runs in chunks of config.BULK_CHUNK_SIZE, yielding NDJSON predictions."""
+    runs = []
+    try:
+        line_number = 0
+        async for line in _ndjson_lines(request):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                runs.append(Run.parse_raw(line))
+            except ValidationError as error:
+                yield json.dumps({"line": line_number, "error": error.errors()}, default=str) + "\n"
+                continue
+            if len(runs) == config.BULK_CHUNK_SIZE:
+                yield await _predict_chunk(runs, current, current_batcher)
+                runs = []
+        if runs:
+            yield await _predict_chunk(runs, current, current_batcher)
+    except ValueError as error:
+        logger.error(f"Bulk prediction stopped: {error}")
+        yield json.dumps({"line": line_number, "error": str(error)}) + "\n"
+
+
+@app.post("/predict/bulk", tags=["Prediction"])
+async def predictBulk(request: Request) -> NDJSONResponse:
+    """
+    Predict runs sent as newline-delimited JSON, one run per line.
+    Runs are read and predicted in fixed-size chunks and predictions are streamed back as NDJSON
+    in the order of the runs, so memory use does not grow with the size of the upload.
+    Invalid lines are answered with {"line": ..., "error": ...} records.
+    The whole upload is predicted by one model, whose run_id is sent in the X-Run-Id header.
+    """
+    current, current_batcher = _serving()
+    return NDJSONResponse(
+        _bulk_predictions(request, current, current_batcher),
+        headers={"X-Run-Id": str(current.get("run_id"))},
+    )
+
+
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, port=os.environ.get("PORT", 8000), host="0.0.0.0")
@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple
+
+import numpy as np
+
+from config.config import logger
+
+# Upper bounds of the batch size histogram, in rows
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class _Request(NamedTuple):
+    X: np.ndarray
+    future: Future
+    enqueued: float
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent prediction requests into a single model call.
+    A worker thread waits for the first request, then keeps collecting requests until the batch
+    holds max_batch rows or max_wait seconds passed, stacks them, calls predict_fn once and hands
+    every caller its own slice of the predictions.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        timeout: float = 30.0,
+    ):
+        """
+        :param predict_fn: function predicting a 2D NumPy array of rows
+        :param max_batch: number of rows that closes a batch. Defaults to 64
+        :param max_wait: seconds a batch stays open after its first request. Defaults to 0.002
+        :param timeout: seconds predict waits for the predictions. Defaults to 30
+        """
+        if max_batch < 1 or max_wait < 0:
+            raise ValueError(f"Invalid batch window: max_batch={max_batch}, max_wait={max_wait}")
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        # Guards starting and stopping, so no request is queued behind the stop sentinel
+        self._state_lock = threading.Lock()
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._metrics = {
+            "batches": 0,
+            "requests": 0,
+            "rows": 0,
+            "max_batch_rows": 0,
+            "queue_delay_seconds_total": 0.0,
+            "queue_delay_seconds_max": 0.0,
+            "batch_rows_histogram": {bucket: 0 for bucket in BATCH_SIZE_BUCKETS + [float("inf")]},
+        }
+
+    def start(self) -> "MicroBatcher":
+        """
+        Start the worker thread
+        :return: the batcher itself
+        """
+        with self._state_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._work, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+                self._stopped = False
+        return self
+
+    def stop(self) -> None:
+        """
+        Finish the queued requests and stop the worker thread, later requests are rejected
+        :return:
+        """
+        with self._state_lock:
+            if self._thread is None or self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(None)
+            thread = self._thread
+        thread.join()
+        # Nothing resolves requests left in the queue, their callers must not wait forever
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError("MicroBatcher is stopped"))
+        with self._state_lock:
+            if self._thread is thread:
+                self._thread = None
+
+    def submit(self, X: np.ndarray) -> Future:
+        """
+        Queue rows for prediction
+        :param X: 2D NumPy array with rows to predict
+        :return: future resolved with a NumPy array of predictions
+        """
+        future = Future()
+        with self._state_lock:
+            if self._thread is None or self._stopped:
+                raise RuntimeError("MicroBatcher is not running")
+            self._queue.put(_Request(np.asarray(X), future, time.perf_counter()))
+        return future
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predict rows together with concurrent callers
+        :param X: 2D NumPy array with rows to predict
+        :return: NumPy array with predictions
+        """
+        return self.submit(X).result(timeout=self.timeout)
+
+    def _collect(self, first: _Request) -> List:
+        """
+        Gather requests arriving within the batch window
+        :param first: request opening the batch
+        :return: list of requests, None at the end means the batcher was stopped
+        """
+        batch = [first]
+        rows = len(first.X)
+        deadline = time.perf_counter() + self.max_wait
+        while rows < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = (
+                    self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            batch.append(request)
+            if request is None:
+                break
+            rows += len(request.X)
+        return batch
+
+    def _work(self) -> None:
+        stopped = False
+        while not stopped:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            if batch[-1] is None:
+                batch, stopped = batch[:-1], True
+            self._run(batch)
+
+    def _run(self, batch: List[_Request]) -> None:
+        """
+        Predict a batch and split the predictions between the callers
+        :param batch: requests to predict
+        :return:
+        """
+        started = time.perf_counter()
+        sizes = [len(request.X) for request in batch]
+        try:
+            predictions = np.asarray(self.predict_fn(np.concatenate([r.X for r in batch])))
+        except Exception as exception:
+            logger.error(f"Batch of {sum(sizes)} rows failed: {exception}")
+            for request in batch:
+                request.future.set_exception(exception)
+        else:
+            for request, part in zip(batch, np.split(predictions, np.cumsum(sizes)[:-1])):
+                request.future.set_result(part)
+        self._record(sizes, [started - request.enqueued for request in batch])
+
+    def _record(self, sizes: List[int], delays: List[float]) -> None:
+        rows = sum(sizes)
+        with self._lock:
+            metrics = self._metrics
+            metrics["batches"] += 1
+            metrics["requests"] += len(sizes)
+            metrics["rows"] += rows
+            metrics["max_batch_rows"] = max(metrics["max_batch_rows"], rows)
+            metrics["queue_delay_seconds_total"] += sum(delays)
+            metrics["queue_delay_seconds_max"] = max(metrics["queue_delay_seconds_max"], *delays)
+            bucket = next(b for b in metrics["batch_rows_histogram"] if rows <= b)
+            metrics["batch_rows_histogram"][bucket] += 1
+
+    def metrics(self) -> Dict:
+        """
+        Batch size and queueing delay statistics
+        :return: dictionary with counters, means, maxima and a histogram of rows per batch
+        """
+        with self._lock:
+            metrics = {**self._metrics}
+            metrics["batch_rows_histogram"] = {
+                str(bucket): count
+                for bucket, count in self._metrics["batch_rows_histogram"].items()
+            }
+        batches, requests = metrics["batches"], metrics["requests"]
+        metrics["mean_batch_rows"] = metrics["rows"] / batches if batches else 0.0
+        metrics["mean_batch_requests"] = requests / batches if batches else 0.0
+        metrics["mean_queue_delay_seconds"] = (
+            metrics["queue_delay_seconds_total"] / requests if requests else 0.0
+        )
+        return metrics
@@ -0,0 +1,113 @@
+import json
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Union
+
+from config.config import logger
+
+
+class RequestCapture:
+    """
+    Append a sample of prediction requests to a JSON lines file, for replaying them later.
+    The request path only draws a random number and puts the payload on a bounded queue,
+    a writer thread serializes and writes the payloads and flushes the file whenever the queue
+    runs empty. Payloads arriving while the queue is full are dropped, never waited for.
+    """
+
+    def __init__(
+        self,
+        filepath: Union[str, Path],
+        sample_rate: float = 0.01,
+        max_queue: int = 10_000,
+        max_bytes: int = None,
+    ):
+        """
+        :param filepath: location of the JSON lines file, appended to
+        :param sample_rate: fraction of requests captured. Defaults to 0.01
+        :param max_queue: number of payloads waiting to be written. Defaults to 10000
+        :param max_bytes: size at which the file stops growing, None for no limit.
+            Defaults to None
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"Invalid sample rate: {sample_rate}, expected a value in [0, 1]")
+        self.filepath = Path(filepath)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._metrics = {"sampled": 0, "written": 0, "dropped": 0}
+
+    def start(self) -> "RequestCapture":
+        """
+        Start the writer thread
+        :return: the capture itself
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            self._thread = threading.Thread(target=self._work, name="request-capture", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Write the queued payloads and stop the writer thread
+        :return:
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def capture(self, route: str, payload: Any) -> bool:
+        """
+        Queue the payload of a request, if it is sampled
+        :param route: path of the route called
+        :param payload: JSON serializable body or a pydantic model of it, serialized by the writer
+        :return: whether the payload was queued
+        """
+        if self._thread is None or random.random() >= self.sample_rate:
+            return False
+        try:
+            self._queue.put_nowait((time.time(), route, payload))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("sampled")
+        return True
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._metrics[key] += 1
+
+    def _work(self) -> None:
+        with open(self.filepath, "a") as file:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                timestamp, route, payload = item
+                if self.max_bytes is not None and file.tell() >= self.max_bytes:
+                    self._count("dropped")
+                    continue
+                try:
+                    body = payload.dict() if hasattr(payload, "dict") else payload
+                    file.write(json.dumps({"time": timestamp, "route": route, "body": body}) + "\n")
+                except (TypeError, ValueError) as error:
+                    logger.error(f"Request to {route} was not captured: {error}")
+                    self._count("dropped")
+                    continue
+                self._count("written")
+                if self._queue.empty():
+                    file.flush()
+
+    def metrics(self) -> Dict:
+        """
+        Number of sampled, written and dropped payloads
+        :return: dictionary with the counters
+        """
+        with self._lock:
+            return {**self._metrics}
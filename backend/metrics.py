@@ -0,0 +1,222 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Upper bounds of the latency histograms, in seconds
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], **extra: str) -> str:
+    """Prometheus label set, like {stage="predict",le="0.1"}."""
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram of observed values with cumulative buckets and optional labels
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: List[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.buckets = sorted(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), -1)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ["+Inf"], counts):
+                    cumulative += count
+                    labels = _labels(self.label_names, key, le=str(bound))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+STAGE_LATENCY = Histogram(
+    "runsor_stage_latency_seconds", "Latency of the stages of prediction requests", ("stage",)
+)
+REQUEST_LATENCY = Histogram(
+    "runsor_request_latency_seconds", "Latency of HTTP requests", ("method", "route")
+)
+REQUESTS = Counter(
+    "runsor_requests_total", "Number of HTTP requests", ("method", "route", "status")
+)
+PREDICTED_RUNS = Counter("runsor_predicted_runs_total", "Number of runs predicted", ("route",))
+METRICS = [STAGE_LATENCY, REQUEST_LATENCY, REQUESTS, PREDICTED_RUNS]
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of a request
+    :param name: name of the stage
+    :return:
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=name)
+
+
+def timed(name: str, fn: Callable) -> Callable:
+    """
+    Wrap a function, so every call is timed as a stage
+    :param name: name of the stage
+    :param fn: function to time
+    :return: wrapped function
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def gauge(name: str, documentation: str, value: float, labels: Dict[str, str] = None) -> List[str]:
+    """
+    Lines of a gauge read at scrape time
+    :param name: name of the metric
+    :param documentation: description of the metric
+    :param value: current value
+    :param labels: label names and values. Defaults to None
+    :return: lines in Prometheus text format
+    """
+    labels = labels or {}
+    label_set = _labels(tuple(labels), tuple(labels.values()))
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name}{label_set} {value}"]
+
+
+def batching_metrics(metrics: Dict) -> List[str]:
+    """
+    Micro-batcher statistics in Prometheus text format
+    :param metrics: dictionary returned by MicroBatcher.metrics
+    :return: lines in Prometheus text format
+    """
+    name = "runsor_batch_rows"
+    lines = [f"# HELP {name} Number of rows in micro-batches", f"# TYPE {name} histogram"]
+    cumulative = 0
+    for bound, count in metrics["batch_rows_histogram"].items():
+        cumulative += count
+        lines.append(f'{name}_bucket{{le="{"+Inf" if bound == "inf" else bound}"}} {cumulative}')
+    lines.append(f"{name}_sum {metrics['rows']}")
+    lines.append(f"{name}_count {metrics['batches']}")
+    name = "runsor_batch_queue_delay_seconds"
+    lines += [
+        f"# HELP {name} Time requests waited for their micro-batch",
+        f"# TYPE {name} summary",
+        f"{name}_sum {metrics['queue_delay_seconds_total']}",
+        f"{name}_count {metrics['requests']}",
+    ]
+    return lines
+
+
+def render(extra: List[str] = ()) -> str:
+    """
+    All metrics in Prometheus text exposition format
+    :param extra: additional lines, like gauges read at scrape time
+    :return: text of the /metrics endpoint
+    """
+    lines = [line for metric in METRICS for line in metric.collect()]
+    return "\n".join(lines + list(extra)) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them until the response is sent.
+    The start time is kept in the request state, so handlers can time the parsing and validation
+    of their body, which happens before they are called.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        scope.setdefault("state", {})["started"] = start
+        status = {"code": 500}
+
+        async def send_with_status(message: Dict) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS.inc(method=scope["method"], route=route, status=status["code"])
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start, method=scope["method"], route=route
+            )
+
+
+def observe_parsing(state: object) -> None:
+    """
+    Record the time from the arrival of a request until its handler was called
+    :param state: state of the request, holding the start time set by MetricsMiddleware
+    :return:
+    """
+    started = getattr(state, "started", None)
+    if started is not None:
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage="parse_validate")
@@ -0,0 +1,105 @@
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Union
+
+import numpy as np
+
+from config.config import logger
+
+
+def warm_up(artifacts: Dict) -> None:
+    """
+    Run a prediction, so the first request does not pay for lazy initialization
+    :param artifacts: artifacts of a run
+    :return:
+    """
+    model = artifacts["model"]
+    n_features = getattr(model, "n_features_in_", None) or model.n_features
+    model.predict(np.zeros((1, n_features)))
+
+
+class ModelReloader:
+    """
+    Watch the run_id file and hand over the artifacts of every newly promoted run.
+    The new artifacts are loaded and warmed up in a background thread, the service keeps
+    serving the previous run until swap_fn is called with them.
+    """
+
+    def __init__(
+        self,
+        run_id_fp: Union[str, Path],
+        load_fn: Callable[[str], Dict],
+        swap_fn: Callable[[Dict], None],
+        run_id: str,
+        interval: float = 5.0,
+    ):
+        """
+        :param run_id_fp: location of the file with the promoted run_id
+        :param load_fn: function loading artifacts of a run_id
+        :param swap_fn: function switching the service to new artifacts
+        :param run_id: id of the run served now
+        :param interval: seconds between checks of the file. Defaults to 5
+        """
+        self.run_id_fp = Path(run_id_fp)
+        self.load_fn = load_fn
+        self.swap_fn = swap_fn
+        self.run_id = run_id
+        self.interval = interval
+        self.reloads = 0
+        self._failed = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def check(self) -> bool:
+        """
+        Reload once if the promoted run_id changed
+        :return: whether new artifacts were swapped in
+        """
+        try:
+            run_id = self.run_id_fp.read_text().strip()
+        except OSError as error:
+            logger.error(f"Cannot read {self.run_id_fp}: {error}")
+            return False
+        # A run that failed to load is retried only after another run is promoted
+        if not run_id or run_id in (self.run_id, self._failed):
+            return False
+
+        logger.info(f"Loading run {run_id} to replace run {self.run_id}")
+        try:
+            artifacts = self.load_fn(run_id)
+            warm_up(artifacts)
+        except Exception as error:
+            logger.error(
+                f"Run {run_id} could not be loaded, still serving run {self.run_id}: {error}"
+            )
+            self._failed = run_id
+            return False
+        self.swap_fn(artifacts)
+        self.run_id, self._failed = run_id, None
+        self.reloads += 1
+        logger.info(f"Serving run {run_id}")
+        return True
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def start(self) -> "ModelReloader":
+        """
+        Start watching in a background thread
+        :return: the reloader itself
+        """
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="model-reloader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop watching
+        :return:
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
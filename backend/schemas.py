@@ -1,5 +1,6 @@
 from typing import List
 
+import numpy as np
 from pydantic import BaseModel, validator
 
 
@@ -13,9 +14,24 @@ class Run(BaseModel):
     elev_loss: int
 
 
+# Run fields in the order of the model features
+FEATURES = list(Run.__fields__)
+# Columns of the training data the run fields stand for, in the same order
+COLUMNS = ["Distance", "Time", "Avg HR", "Avg Run Cadence", "Avg Pace", "Elev Gain", "Elev Loss"]
+
+
+def runs_to_array(runs: List[Run]) -> np.ndarray:
+    """Features of the runs as a float array, without a JSON round trip."""
+    return np.array([[getattr(run, name) for name in FEATURES] for run in runs], dtype=float)
+
+
 class RunningPack(BaseModel):
     runs: List[Run]
 
+    def to_array(self) -> np.ndarray:
+        """runs_to_array of the pack's runs."""
+        return runs_to_array(self.runs)
+
     @validator("runs")
     def not_empty_list(cls, value):
         if not len(value):
@@ -1,10 +1,8 @@
 import logging.config
+import os
 import sys
 from pathlib import Path
 
-import mlflow
-from rich.logging import RichHandler
-
 # Assets
 DATA_URL = (
     "https://raw.githubusercontent.com/AdrianSzymczyk/AdrianSzymczyk/main/datasets/activity_log.csv"
@@ -21,15 +19,49 @@ LOGS_DIR = Path(BASE_DIR, "logs")
 # Stores
 MODEL_REGISTRY = Path(STORES_DIR, "model")
 BLOB_STORE = Path(STORES_DIR, "blob")
+PREPROCESSED_STORE = Path(BLOB_STORE, "preprocessed")
+OPTUNA_STORE = Path(STORES_DIR, "optuna")
+SERVING_STORE = Path(STORES_DIR, "serving")
+
+# Self-contained bundle of the promoted run, loaded by the API without MLflow
+SERVING_BUNDLE = Path(SERVING_STORE, "bundle.tar")
+
+# Number of runs whose artifacts are kept in memory
+ARTIFACT_CACHE_SIZE = 4
+
+# Micro-batching of concurrent API predictions
+MICRO_BATCHING = True
+BATCH_MAX_SIZE = 64  # rows
+BATCH_MAX_WAIT = 0.002  # seconds
+BATCH_TIMEOUT = 30.0  # seconds a caller waits for its predictions
+
+# Async prediction route
+PREDICT_WORKERS = 4  # threads running the model
+PREDICT_QUEUE_SIZE = 64  # predictions in flight, further requests wait for a free slot
+
+# Streaming bulk prediction route
+BULK_CHUNK_SIZE = 1000  # runs predicted at once
+BULK_MAX_LINE_BYTES = 65536
+
+# Hot reload of a newly promoted run_id.txt
+HOT_RELOAD = True
+RELOAD_INTERVAL = 5.0  # seconds between checks of run_id.txt
+RELOAD_GRACE_PERIOD = 30.0  # seconds the previous micro-batcher keeps running after a swap
 
-# Create dirs
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-MODEL_REGISTRY.mkdir(parents=True, exist_ok=True)
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
-BLOB_STORE.mkdir(parents=True, exist_ok=True)
+# Capture of sampled /predict payloads for replaying them
+REQUEST_CAPTURE = False
+CAPTURE_FP = Path(LOGS_DIR, "requests.jsonl")
+CAPTURE_SAMPLE_RATE = 0.01  # fraction of requests captured
+CAPTURE_QUEUE_SIZE = 10_000  # payloads waiting to be written, further ones are dropped
+CAPTURE_MAX_BYTES = 100 * 2**20  # size at which the capture file stops growing
+
+# Cached predictions of single runs
+PREDICTION_CACHE_SIZE = 10_000
+PREDICTION_CACHE_TTL = 3600  # seconds, None to keep predictions until evicted
+PREDICTION_CACHE_MAX_ROWS = 16  # larger batches are predicted without the cache
 
 # MLFlow model registry
-mlflow.set_tracking_uri("file://" + str(MODEL_REGISTRY.absolute()))
+TRACKING_URI = "file://" + str(MODEL_REGISTRY.absolute())
 
 logging_config = {
     "version": 1,
@@ -71,6 +103,30 @@ logging_config = {
     },
 }
 
-logging.config.dictConfig(logging_config)
 logger = logging.getLogger()
-logger.handlers[0] = RichHandler(markup=True)  # pretty formatting
+
+# Whether init was called in this process
+_initialized = False
+
+
+def init() -> None:
+    """
+    Create the directories, point MLflow at the model registry and configure logging.
+    Importing the config has no side effects, entry points (CLI, API, Streamlit app, tests)
+    call this once before doing any work, further calls do nothing.
+    :return:
+    """
+    global _initialized
+    if _initialized:
+        return
+    for directory in [DATA_DIR, MODEL_REGISTRY, LOGS_DIR, PREPROCESSED_STORE, OPTUNA_STORE]:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    # Read by MLflow when it is first used, also by worker processes, without importing it here
+    os.environ["MLFLOW_TRACKING_URI"] = TRACKING_URI
+
+    from rich.logging import RichHandler
+
+    logging.config.dictConfig(logging_config)
+    logger.handlers[0] = RichHandler(markup=True)  # pretty formatting
+    _initialized = True
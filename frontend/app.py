@@ -5,10 +5,11 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import streamlit as st
 
+import runsor.artifacts
 import runsor.data
 from config import config
 from frontend import data as frontdata
-from runsor import data, main, utils
+from runsor import data, utils
 
 
 def highlight_col(col) -> List:
@@ -29,8 +30,7 @@ st.set_page_config(page_title="RunSor", initial_sidebar_state="expanded", page_i
 
 
 def app():
-    # Read data from csv file
-    df = pd.read_csv(Path(config.DATA_DIR, "activity_log.csv"))
+    data_fp = Path(config.DATA_DIR, "activity_log.csv")
     # Tittle
     st.title("RunSor · Running ML Project")
 
@@ -42,14 +42,16 @@ def app():
     if choices == "Data display":
         st.header(":1234: Data")
         # Load and display project data
+        df = pd.read_csv(data_fp)
         st.text(f"Running trainings: {len(df)}")
         st.write(df)
     # ************************* End Data display section ***************************
 
     # ************************* Start Analysis charts section ***************************
     if choices == "Analysis charts":
-        # Transforming data to plot charts
-        df = data.plots_transform(df)
+        # Transforming data to plot charts, the file is streamed in chunks
+        df = data.load_preprocessed(data_fp, chunk_size=data.CHUNK_SIZE, drop_col=False)
+        df = data.plots_transform(df, preprocessed=True)
         tab1, tab2, tab3 = st.tabs(["Avg Pace ", "Distance", "Calories vs Distance"])
 
         # Display of distribution of Average Pace chart
@@ -141,7 +143,7 @@ def app():
                             "Elev Loss": elev_loss,
                         }
                         # Predict value for given data and display them
-                        prediction = main.predict_value(run, run_id)
+                        prediction = runsor.artifacts.predict_value(run, run_id)
                         calories = prediction[0]["predicted_calories"]
                         st.subheader(f":fire: You burned :red[{calories}] calories")
                     # Raise error when values are not correct
@@ -162,7 +164,7 @@ def app():
                 try:
                     if len(dataframe.columns) != 7:
                         dataframe = runsor.data.preprocess(dataframe)
-                    predictions = main.predict_value(dataframe, run_id)
+                    predictions = runsor.artifacts.predict_value(dataframe, run_id)
                     # Append calculated calories to an empty list
                     calories: List = []
                     for run in predictions:
@@ -177,4 +179,5 @@ def app():
 
 
 if __name__ == "__main__":
+    config.init()
     app()
@@ -1,29 +1,38 @@
-from datetime import datetime
+from typing import Union
 
+import pandas as pd
 
-def time_conversion(time: str) -> int:
+from runsor import data
+
+
+def _durations(values: Union[str, pd.Series], kind: str) -> Union[int, pd.Series]:
+    """
+    Convert a duration or a column of durations into seconds
+    :param values: string or Pandas Series of strings
+    :param kind: duration kind of runsor.data.parse_durations
+    :return: seconds as an integer for a string, as a Pandas Series for a column
+    """
+    single = isinstance(values, str)
+    seconds, invalid = data.parse_durations(pd.Series([values]) if single else values, kind=kind)
+    if not invalid.empty:
+        raise ValueError(f"Invalid {kind} format at {len(invalid)} rows: {invalid[:20].tolist()}")
+    return int(seconds.iloc[0]) if single else seconds
+
+
+def time_conversion(time: Union[str, pd.Series]) -> Union[int, pd.Series]:
     """
     Convert time into seconds
-    :param time: String representing time. Accepted format (%H:%M:%S)
-    :return: Time represented in seconds
+    :param time: String or Pandas Series representing time. Accepted format (%H:%M:%S)
+    :return: Time represented in seconds, a ValueError lists the index of invalid values
     """
-    try:
-        time_formatted = datetime.strptime(time, "%H:%M:%S").time()
-        seconds = (time_formatted.hour * 60 + time_formatted.minute) * 60 + time_formatted.second
-        return seconds
-    except ValueError:
-        print("Invalid time format")
+    return _durations(time, kind="clock")
 
 
-def pace_conversion(pace: str) -> int:
+def pace_conversion(pace: Union[str, pd.Series]) -> Union[int, pd.Series]:
     """
     Convert pace into seconds
-    :param pace: String representing pace, excepted units minutes/km. Accepted format (%M:%S)
-    :return: Running pace represented in seconds
+    :param pace: String or Pandas Series representing pace, excepted units minutes/km.
+    Accepted format (%M:%S)
+    :return: Running pace represented in seconds, a ValueError lists the index of invalid values
     """
-    try:
-        pace_formatted = datetime.strptime(pace, "%M:%S").time()
-        seconds = pace_formatted.minute * 60 + pace_formatted.second
-        return seconds
-    except ValueError:
-        print("Invalid pace format")
+    return _durations(pace, kind="pace")
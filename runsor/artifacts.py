@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from argparse import Namespace
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Union
+
+import pandas as pd
+
+from config import config
+from config.config import logger
+from runsor import inference, predict, utils
+
+# Artifacts of recently used runs, keyed by run_id and model format
+ARTIFACT_CACHE = utils.LRUCache(maxsize=config.ARTIFACT_CACHE_SIZE)
+# Files holding the model in each artifact format
+MODEL_FORMATS = {"pickle": "model.pkl", "flat": "forest/meta.json"}
+# Layout of serving bundles, bumped on incompatible changes
+BUNDLE_VERSION = 1
+# Files of a serving bundle besides its manifest
+BUNDLE_FILES = ["args.json", "performance.json", "model.pkl"]
+
+
+def _artifacts_dir(run_id: str) -> Path:
+    """
+    Locate the artifacts directory of a run
+    :param run_id: id of the run
+    :return: location of the run's artifacts
+    """
+    # MLflow is slow to import and only needed to locate the run
+    from mlflow.tracking import MlflowClient
+
+    # Registry of the config, whether or not config.init() set up MLflow in this process
+    client = MlflowClient(tracking_uri=config.TRACKING_URI)
+    experiment_id = client.get_run(run_id).info.experiment_id
+    return Path(config.MODEL_REGISTRY, experiment_id, run_id, "artifacts")
+
+
+def _artifacts_signature(artifacts_dir: Path, model_format: str) -> tuple:
+    """
+    Modification time and size of every artifact file, changes when a file is rewritten
+    :param artifacts_dir: location of the run's artifacts
+    :param model_format: format of the loaded model, one of MODEL_FORMATS
+    :return: tuple with (mtime in ns, size) of each file
+    """
+    files = ["args.json", MODEL_FORMATS[model_format], "performance.json"]
+    return tuple(
+        (stat.st_mtime_ns, stat.st_size)
+        for stat in (Path(artifacts_dir, name).stat() for name in files)
+    )
+
+
+def load_artifacts(
+    run_id: str = None, use_cache: bool = True, model_format: str = "pickle"
+) -> Dict:
+    """
+    Load artifacts for a given run_id.
+    Artifacts are kept in ARTIFACT_CACHE and reloaded only when their files change on disk,
+    so the returned dictionary is shared between callers and must not be modified.
+    :param run_id: id of run to load artifacts from. Defaults as None.
+    :param use_cache: whether to reuse artifacts loaded before. Defaults to True
+    :param model_format: "pickle" for the joblib model, "flat" for the memory mapped
+    inference.FlatForest, which processes loading the same run share. Defaults to "pickle"
+    :return: Dictionary with run's artifacts
+    """
+    if model_format not in MODEL_FORMATS:
+        raise ValueError(
+            f"Invalid model format: {model_format}, expected one of {list(MODEL_FORMATS)}"
+        )
+    if not run_id:
+        run_id = open(Path(config.CONFIG_DIR, "run_id.txt")).read()
+
+    key = (run_id, model_format)
+    if use_cache:
+        # Artifacts changed on disk since they were cached count as a miss
+        cached = ARTIFACT_CACHE.get(
+            key, valid=lambda item: _artifacts_signature(item[0], model_format) == item[1]
+        )
+        if cached is not None:
+            return cached[2]
+
+    # Locate specifics artifacts directory
+    artifacts_dir = _artifacts_dir(run_id)
+
+    # Load objects from run
+    signature = _artifacts_signature(artifacts_dir, model_format)
+    args = Namespace(**utils.load_dict(filepath=Path(artifacts_dir, "args.json")))
+    if model_format == "flat":
+        model = inference.FlatForest.load(Path(artifacts_dir, "forest"))
+    else:
+        import joblib
+
+        model = joblib.load(Path(artifacts_dir, "model.pkl"))
+    performance = utils.load_dict(filepath=Path(artifacts_dir, "performance.json"))
+
+    artifacts = {
+        "args": args,
+        "model": model,
+        "performance": performance,
+        "run_id": run_id,
+        "signature": signature,
+    }
+    if use_cache:
+        ARTIFACT_CACHE.put(key, (artifacts_dir, signature, artifacts))
+    return artifacts
+
+
+def predict_value(
+    data: Union[Dict, pd.DataFrame], run_id: str = None, shape: str = "rows"
+) -> Union[List, Dict]:
+    """
+    Predict calories burned during the run
+    :param data: Input dictionary or pandas DataFrame to predict calories
+    :param run_id: run id to load artifacts for prediction. Defaults on None
+    :param shape: "rows" for a dictionary per run, "columns" for a list of predictions.
+        Defaults to "rows"
+    :return:
+    """
+    if isinstance(data, Dict):
+        key = list(data.keys())[0]
+        if type(data[key]) == list:
+            df = pd.DataFrame(data)
+        else:
+            df = pd.DataFrame(data, index=[0])
+    elif isinstance(data, pd.DataFrame):
+        df = data
+    else:
+        raise ValueError("Invalid input data type. Expected dictionary of pandas DataFrame")
+    artifacts = load_artifacts(run_id)
+    prediction = predict.predict(data=df, artifacts=artifacts, shape=shape)
+    return prediction
+
+
+def save_bundle(
+    filepath: Union[str, Path],
+    artifacts: Dict,
+    run_id: str,
+    features: List[str],
+    dtype: str = "float64",
+) -> Path:
+    """
+    Write a serving bundle, a tar file with everything needed to serve a run.
+    Its manifest.json holds the run_id, the order and type of the features and the SHA-256
+    checksum of every other file.
+    :param filepath: location of the bundle, its directory is created when missing
+    :param artifacts: dictionary with "args", "model" and "performance" of a trained run
+    :param run_id: id of the run
+    :param features: names of the model features in training order
+    :param dtype: type of the feature arrays the model was trained on. Defaults to "float64"
+    :return: location of the bundle
+    """
+    import joblib
+    from numpyencoder import NumpyEncoder
+
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as dp:
+        utils.save_dict(vars(artifacts["args"]), Path(dp, "args.json"), cls=NumpyEncoder)
+        utils.save_dict(artifacts["performance"], Path(dp, "performance.json"))
+        joblib.dump(artifacts["model"], Path(dp, "model.pkl"))
+        manifest = {
+            "version": BUNDLE_VERSION,
+            "run_id": run_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "features": list(features),
+            "dtype": dtype,
+            "sha256": {name: utils.file_hash(Path(dp, name)) for name in BUNDLE_FILES},
+        }
+        utils.save_dict(manifest, Path(dp, "manifest.json"))
+
+        # Renamed once complete, so a reloading service never reads a partial bundle
+        tmp_fp = filepath.with_suffix(f".{os.getpid()}.tmp")
+        with tarfile.open(tmp_fp, "w") as tar:
+            for name in ["manifest.json"] + BUNDLE_FILES:
+                tar.add(Path(dp, name), arcname=name)
+        os.replace(tmp_fp, filepath)
+    logger.info(f"Saved serving bundle of run {run_id} to {filepath}")
+    return filepath
+
+
+def promote_bundle(filepath: Union[str, Path]) -> Path:
+    """
+    Make a bundle the one served, by copying it to config.SERVING_BUNDLE
+    :param filepath: location of the bundle
+    :return: location of the served bundle
+    """
+    config.SERVING_BUNDLE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fp = config.SERVING_BUNDLE.with_suffix(f".{os.getpid()}.tmp")
+    shutil.copyfile(filepath, tmp_fp)
+    os.replace(tmp_fp, config.SERVING_BUNDLE)
+    return config.SERVING_BUNDLE
+
+
+def read_manifest(filepath: Union[str, Path]) -> Dict:
+    """
+    Read the manifest of a serving bundle without loading the model
+    :param filepath: location of the bundle
+    :return: dictionary with the manifest
+    """
+    with tarfile.open(filepath) as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))
+    if manifest.get("version") != BUNDLE_VERSION:
+        raise ValueError(
+            f"Unsupported bundle version: {manifest.get('version')}, expected {BUNDLE_VERSION}"
+        )
+    return manifest
+
+
+def load_bundle(
+    filepath: Union[str, Path], verify: bool = True, features: List[str] = None
+) -> Dict:
+    """
+    Load a serving bundle, neither MLflow nor the model registry are needed
+    :param filepath: location of the bundle
+    :param verify: whether to check the files against the checksums of the manifest.
+        Defaults to True
+    :param features: features in the order the caller passes them, the bundle's model must
+        be trained on the same. Defaults to None, not checked
+    :return: dictionary with the run's artifacts, its features and dtype
+    """
+    import joblib
+
+    manifest = read_manifest(filepath)
+    if features is not None and manifest["features"] != list(features):
+        raise ValueError(
+            f"Model of bundle {filepath} predicts features {manifest['features']}, "
+            f"expected {list(features)}"
+        )
+    with tarfile.open(filepath) as tar:
+        if verify:
+            for name, checksum in manifest["sha256"].items():
+                digest = hashlib.sha256()
+                file = tar.extractfile(name)
+                for block in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(block)
+                if digest.hexdigest() != checksum:
+                    raise ValueError(f"Checksum of {name} in bundle {filepath} does not match")
+        args = Namespace(**json.load(tar.extractfile("args.json")))
+        performance = json.load(tar.extractfile("performance.json"))
+        model = joblib.load(tar.extractfile("model.pkl"))
+    return {
+        "args": args,
+        "model": model,
+        "performance": performance,
+        "run_id": manifest["run_id"],
+        "signature": tuple(sorted(manifest["sha256"].items())),
+        "features": manifest["features"],
+        "dtype": manifest["dtype"],
+    }
+
+
+def load_serving_artifacts(run_id: str, features: List[str] = None) -> Dict:
+    """
+    Load the artifacts of a run for serving, from config.SERVING_BUNDLE when it holds the run,
+    otherwise from the model registry
+    :param run_id: id of the run
+    :param features: features in the order they are served, checked against the bundle.
+        Defaults to None, not checked
+    :return: dictionary with the run's artifacts
+    """
+    if config.SERVING_BUNDLE.exists():
+        try:
+            bundle_run_id = read_manifest(config.SERVING_BUNDLE)["run_id"]
+        except (OSError, KeyError, ValueError, tarfile.TarError) as error:
+            logger.error(f"Serving bundle {config.SERVING_BUNDLE} is unreadable: {error}")
+        else:
+            if bundle_run_id == run_id:
+                return load_bundle(config.SERVING_BUNDLE, features=features)
+    # Images of the service ship the bundle only, without the model registry
+    if not any(Path(config.MODEL_REGISTRY).glob(f"*/{run_id}")):
+        raise FileNotFoundError(
+            f"Run {run_id} is neither in the serving bundle {config.SERVING_BUNDLE} nor in the "
+            f"model registry, build its bundle with: python -m runsor.main bundle-run "
+            f"--run-id {run_id}"
+        )
+    return load_artifacts(run_id=run_id)
@@ -1,12 +1,29 @@
+import hashlib
+import logging
+import os
 from datetime import datetime
-from typing import Tuple
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 
-import frontend.data
+from config import config
 from config.config import logger
+from runsor import profiling, utils
+
+
+def pace_converter(pace: str) -> int:
+    """
+    Convert pace in %M:%S format into seconds
+    :param pace: String with running pace
+    :return: Running pace represented in seconds, None for an invalid pace
+    """
+    try:
+        pace_formatted = datetime.strptime(pace, "%M:%S").time()
+    except ValueError:
+        return None
+    return pace_formatted.minute * 60 + pace_formatted.second
 
 
 def pace_to_km_converter(pace: str) -> float:
@@ -22,33 +39,318 @@ def pace_to_km_converter(pace: str) -> float:
     return pace_per_km
 
 
-def time_converter(df: pd.DataFrame, time_col: str) -> pd.DataFrame:
+# Number of ":" separated fields and whether a single fractional digit is expected
+DURATION_FORMATS = {
+    # Garmin running time, %M:%S.%f or %H:%M:%S
+    "time": [(2, True), (3, False)],
+    # Time typed in the frontend, %H:%M:%S
+    "clock": [(3, False)],
+    # Pace typed in the frontend, %M:%S
+    "pace": [(2, False)],
+}
+MAX_DURATION_LENGTH = 10
+
+
+def _duration_bytes(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Store durations as a matrix of ASCII codes, one row per value
+    :param values: Pandas Series with durations stored as strings
+    :return: NumPy uint8 matrix with characters and mask of rows that cannot be a duration
+    """
+    strings = values.astype(str)
+    rejected = np.zeros(len(strings), dtype=bool)
+    try:
+        encoded = strings.to_numpy().astype("S")
+    except UnicodeEncodeError:
+        rejected = ~strings.map(str.isascii).to_numpy()
+        encoded = strings.where(~rejected, "").to_numpy().astype("S")
+    if encoded.itemsize > MAX_DURATION_LENGTH:
+        # Values that are too long cannot be a duration, blank them to keep the matrix narrow
+        too_long = (strings.str.len() > MAX_DURATION_LENGTH).to_numpy()
+        rejected |= too_long
+        encoded = np.where(too_long, b"", encoded).astype(f"S{MAX_DURATION_LENGTH}")
+    if encoded.itemsize == 0:
+        encoded = encoded.astype("S1")
+    return encoded.view(np.uint8).reshape(len(encoded), encoded.itemsize), rejected
+
+
+def parse_durations(values: pd.Series, kind: str = "time") -> Tuple[pd.Series, pd.Index]:
+    """
+    Convert a column of durations into seconds without parsing rows one by one
+    :param values: Pandas Series with durations stored as strings
+    :param kind: "time" for Garmin running time (%M:%S.%f or %H:%M:%S), "clock" for %H:%M:%S,
+    "pace" for %M:%S. Defaults on "time"
+    :return: Pandas Series with whole seconds (NaN for invalid rows) and index of invalid rows
+    """
+    if kind not in DURATION_FORMATS:
+        raise ValueError(f"Unknown duration kind: {kind}. Expected one of {list(DURATION_FORMATS)}")
+
+    chars, invalid = _duration_bytes(values)
+    n = len(chars)
+    rows = np.arange(n)
+    fields = np.zeros((n, 3), dtype=np.int64)
+    current = np.zeros(n, dtype=np.int64)
+    digits = np.zeros(n, dtype=np.int64)
+    colons = np.zeros(n, dtype=np.int64)
+    fraction = np.zeros(n, dtype=np.int64)
+    dotted = np.zeros(n, dtype=bool)
+
+    # Scan all rows one character position at a time
+    for position in range(chars.shape[1]):
+        char = chars[:, position]
+        is_digit = (char >= ord("0")) & (char <= ord("9"))
+        is_colon = char == ord(":")
+        is_dot = char == ord(".")
+        invalid |= ~(is_digit | is_colon | is_dot | (char == 0))
+
+        # Fractional seconds are dropped like in int(timedelta.total_seconds())
+        fraction += is_digit & dotted
+        whole = is_digit & ~dotted
+        current = np.where(whole, current * 10 + (char.astype(np.int64) - ord("0")), current)
+        digits += whole
+
+        ends_field = is_colon | is_dot
+        invalid |= ends_field & (dotted | (digits == 0) | (digits > 2) | (colons > 1))
+        invalid |= is_colon & dotted
+        field = np.minimum(colons, 2)
+        fields[rows, field] = np.where(ends_field, current, fields[rows, field])
+        colons += is_colon
+        dotted |= is_dot
+        current = np.where(ends_field, 0, current)
+        digits = np.where(ends_field, 0, digits)
+
+    # Last field ends with the string
+    last = ~dotted
+    invalid |= last & ((digits == 0) | (digits > 2))
+    field = np.minimum(colons, 2)
+    fields[rows, field] = np.where(last, current, fields[rows, field])
+
+    matched = np.zeros(n, dtype=bool)
+    for count, fractional in DURATION_FORMATS[kind]:
+        if fractional:
+            matched |= dotted & (colons == count - 1) & (fraction == 1)
+        else:
+            matched |= ~dotted & (colons == count - 1)
+    invalid |= ~matched
+
+    # Right align fields into hours, minutes and seconds
+    three = colons == 2
+    hours = np.where(three, fields[:, 0], 0)
+    minutes = np.where(three, fields[:, 1], fields[:, 0])
+    seconds = np.where(three, fields[:, 2], fields[:, 1])
+    # Same limits as datetime.strptime
+    invalid |= (hours > 23) | (minutes > 59) | (seconds > 59)
+
+    durations = pd.Series((hours * 60 + minutes) * 60 + seconds, index=values.index)
+    if invalid.any():
+        durations = durations.where(~invalid)
+    else:
+        durations = durations.astype(int)
+    return durations, values.index[invalid]
+
+
+def time_converter(df: pd.DataFrame, time_col: str, engine: str = "columnar") -> pd.DataFrame:
     """
     Convert running time into seconds
     :param df: Pandas DataFrame with the data
     :param time_col: name of the DataFrame column that has times, possible format: %M:%S.%MS, %H:%M:%S
+    :param engine: "columnar" parses the whole column at once, "python" parses row by row.
+    Defaults on "columnar"
     :return:
     DataFrame with converted time column
     """
-    # Convert data into datetime object
-    df[time_col] = df[time_col].apply(
-        lambda x: datetime.strptime(x, "%M:%S.%f").time()
-        if x[-2] == "."
-        else datetime.strptime(x, "%H:%M:%S").time()
-    )
-    # Convert running time into seconds
-    df[time_col] = pd.to_timedelta(df[time_col].astype(str)).dt.total_seconds().astype(int)
+    if engine == "python":
+        # Convert data into datetime object
+        df[time_col] = df[time_col].apply(
+            lambda x: datetime.strptime(x, "%M:%S.%f").time()
+            if x[-2] == "."
+            else datetime.strptime(x, "%H:%M:%S").time()
+        )
+        # Convert running time into seconds
+        df[time_col] = pd.to_timedelta(df[time_col].astype(str)).dt.total_seconds().astype(int)
+        return df
+
+    seconds, invalid = parse_durations(df[time_col], kind="time")
+    if not invalid.empty:
+        raise ValueError(
+            f"Invalid time format in column '{time_col}' at {len(invalid)} rows: "
+            f"{invalid[:20].tolist()}"
+        )
+    df[time_col] = seconds
     return df
 
 
-def preprocess(df: pd.DataFrame, mile_units: bool = True, drop_col: bool = True) -> pd.DataFrame:
+def _to_int_column(values: pd.Series) -> pd.Series:
     """
-    Preprocess the data
+    Columnar counterpart of int(float(str(x).replace(",", ""))) applied row by row
+    :param values: Pandas Series with numbers, possibly stored as strings with thousands separators
+    :return: Pandas Series with integer values
+    """
+    if not pd.api.types.is_numeric_dtype(values):
+        try:
+            values = pd.Series(_parse_numbers(values), index=values.index)
+        except UnicodeEncodeError:
+            values = values.astype(str).str.replace(",", "", regex=False)
+    return values.astype(float).astype(np.int64)
+
+
+def _parse_numbers(values: pd.Series) -> np.ndarray:
+    """
+    Parse numbers stored as strings with thousands separators, without a Python loop per value
+    :param values: Pandas Series with numbers stored as ASCII strings
+    :return: NumPy float array
+    """
+    encoded = values.astype(str).to_numpy().astype("S")
+    if encoded.itemsize == 0:
+        encoded = encoded.astype("S1")
+    width = encoded.itemsize
+    chars = encoded.view(np.uint8).reshape(len(encoded), width)
+    comma = chars == ord(",")
+    if comma.any():
+        # Move separators to the end of every row and blank them, trailing NUL bytes are ignored
+        order = np.argsort(comma, axis=1, kind="stable")
+        chars = np.take_along_axis(chars, order, axis=1)
+        chars[np.take_along_axis(comma, order, axis=1)] = 0
+        encoded = np.ascontiguousarray(chars).view(f"S{width}").ravel()
+    return encoded.astype(np.float64)
+
+
+def _round_half_even(values: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    Round values exactly like Python's built-in round
+    :param values: NumPy array with float values
+    :param decimals: number of decimal places
+    :return: NumPy array with rounded values
+    """
+    scaled = values * 10**decimals
+    rounded = np.round(scaled) / 10**decimals
+    # Scaling may move a value across a .5 boundary, fall back to Python for those few
+    ties = np.flatnonzero(np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6)
+    for i in ties:
+        rounded[i] = round(float(values[i]), decimals)
+    return rounded
+
+
+def _pace_to_seconds(pace: pd.Series) -> pd.Series:
+    """
+    Columnar conversion of pace in %M:%S format into seconds
+    :param pace: Pandas Series with running pace
+    :return: Pandas Series with pace represented in seconds
+    """
+    seconds, invalid = parse_durations(pace, kind="pace")
+    if not invalid.empty:
+        # Paces of an hour or more are still minutes and seconds, malformed ones raise
+        parts = pace[invalid].astype(str).str.split(":", n=1, expand=True)
+        parts = parts.reindex(columns=[0, 1])
+        seconds[invalid] = parts[0].astype(np.int64) * 60 + parts[1].astype(np.int64)
+    return seconds.astype(np.int64)
+
+
+def _preprocess_python(df: pd.DataFrame, mile_units: bool) -> pd.DataFrame:
+    """
+    Clean and convert columns row by row with Python functions
+    :param df: Pandas DataFrame with filtered data
+    :param mile_units: whether to convert pace from miles
+    :return: Pandas DataFrame with converted columns
+    """
+    # Convert data with comma
+    try:
+        df["Elev Gain"] = df["Elev Gain"].apply(lambda x: int(float(str(x).replace(",", ""))))
+        df["Elev Loss"] = df["Elev Loss"].apply(lambda x: int(float(str(x).replace(",", ""))))
+        df["Calories"] = df["Calories"].apply(lambda x: int(float(str(x).replace(",", ""))))
+    except KeyError as err:
+        logger.error(err)
+    df = _convert_types(df)
+
+    # Running time and pace conversion
+    df = time_converter(df, "Time", engine="python")
+    if mile_units:
+        df["Avg Pace"] = df["Avg Pace"].apply(pace_to_km_converter)
+
+        # Distance calculation from mile to kilometers
+        df["Distance"] = df["Distance"].apply(lambda x: round(x * 1.60934, 2))
+    else:
+        df["Avg Pace"] = df["Avg Pace"].apply(pace_converter)
+    return df
+
+
+def _preprocess_columnar(df: pd.DataFrame, mile_units: bool) -> pd.DataFrame:
+    """
+    Clean and convert whole columns at once with pandas string accessors and NumPy kernels
+    :param df: Pandas DataFrame with filtered data
+    :param mile_units: whether to convert pace from miles
+    :return: Pandas DataFrame with converted columns
+    """
+    # Convert data with comma
+    try:
+        for col in ["Elev Gain", "Elev Loss", "Calories"]:
+            df[col] = _to_int_column(df[col])
+    except KeyError as err:
+        logger.error(err)
+    df = _convert_types(df)
+
+    # Running time and pace conversion
+    df = time_converter(df, "Time")
+    if mile_units:
+        pace = _pace_to_seconds(df["Avg Pace"])
+        df["Avg Pace"] = np.round(pace.values / 1.60934).astype(np.int64)
+
+        # Distance calculation from mile to kilometers
+        distance = df["Distance"].values.astype(float)
+        df["Distance"] = _round_half_even(distance * 1.60934, 2)
+    else:
+        pace, invalid = parse_durations(df["Avg Pace"], kind="pace")
+        if not invalid.empty:
+            logger.error(
+                f"Invalid pace format in column 'Avg Pace' at {len(invalid)} rows: "
+                f"{invalid[:20].tolist()}"
+            )
+        df["Avg Pace"] = pace
+    return df
+
+
+def _convert_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast numeric columns to their final data types
+    :param df: Pandas DataFrame with cleaned data
+    :return: Pandas DataFrame with converted data types
+    """
+    try:
+        df[["Calories", "Avg HR", "Avg Run Cadence"]] = df[
+            ["Calories", "Avg HR", "Avg Run Cadence"]
+        ].astype(int)
+        df[["Elev Gain", "Elev Loss"]] = df[["Elev Gain", "Elev Loss"]].astype(float)
+    except KeyError as err:
+        logger.error(err)
+    return df
+
+
+PREPROCESS_ENGINES = {"columnar": _preprocess_columnar, "python": _preprocess_python}
+
+
+# Number of CSV rows read into memory at once when streaming
+CHUNK_SIZE = 100_000
+# Bump whenever preprocessing output changes, so cached datasets are rebuilt
+PREPROCESS_VERSION = 1
+
+
+def preprocess_frame(
+    df: pd.DataFrame, mile_units: bool = True, drop_col: bool = True, engine: str = "columnar"
+) -> pd.DataFrame:
+    """
+    Clean, convert and optionally drop columns of the data without logging,
+    for chunks and batches preprocessed one after another
     :param df: Pandas DataFrame with original data
     :param mile_units: whether to convert pace from miles
     :param drop_col: whether to drop irrelevant columns for model
+    :param engine: "columnar" or "python". Defaults on "columnar"
     :return: Pandas DataFrame with preprocessed data
     """
+    if engine not in PREPROCESS_ENGINES:
+        raise ValueError(
+            f"Unknown preprocess engine: {engine}. Expected one of {list(PREPROCESS_ENGINES)}"
+        )
+
     # Data cleaning of missing values with indices reset
     try:
         df = df[
@@ -69,40 +371,250 @@ def preprocess(df: pd.DataFrame, mile_units: bool = True, drop_col: bool = True)
     except KeyError as err:
         logger.error(f"{err}")
 
-    # Convert data with comma
-    try:
-        df["Elev Gain"] = df["Elev Gain"].apply(lambda x: int(float(str(x).replace(",", ""))))
-        df["Elev Loss"] = df["Elev Loss"].apply(lambda x: int(float(str(x).replace(",", ""))))
-        df["Calories"] = df["Calories"].apply(lambda x: int(float(str(x).replace(",", ""))))
-    except KeyError as err:
-        logger.error(err)
-    # Data type conversion
-    try:
-        df[["Calories", "Avg HR", "Avg Run Cadence"]] = df[
-            ["Calories", "Avg HR", "Avg Run Cadence"]
-        ].astype(int)
-        df[["Elev Gain", "Elev Loss"]] = df[["Elev Gain", "Elev Loss"]].astype(float)
-    except KeyError as err:
-        logger.error(err)
-
-    # Running time and pace conversion
-    df = time_converter(df, "Time")
-    if mile_units:
-        df["Avg Pace"] = df["Avg Pace"].apply(pace_to_km_converter)
-
-        # Distance calculation from mile to kilometers
-        df["Distance"] = df["Distance"].apply(lambda x: round(x * 1.60934, 2))
-    else:
-        df["Avg Pace"] = df["Avg Pace"].apply(frontend.data.pace_conversion)
+    df = PREPROCESS_ENGINES[engine](df, mile_units)
 
     if drop_col:
         # Drop irrelevant columns from the data
         df = drop_columns(df)
+    return df
 
+
+def preprocess(
+    df: pd.DataFrame, mile_units: bool = True, drop_col: bool = True, engine: str = "columnar"
+) -> pd.DataFrame:
+    """
+    Preprocess the data
+    :param df: Pandas DataFrame with original data
+    :param mile_units: whether to convert pace from miles
+    :param drop_col: whether to drop irrelevant columns for model
+    :param engine: "columnar" converts whole columns at once, "python" converts row by row.
+    Both produce the same output. Defaults on "columnar"
+    :return: Pandas DataFrame with preprocessed data
+    """
+    df = preprocess_frame(df, mile_units, drop_col, engine)
     logger.info("Preprocessing completed!!!")
     return df
 
 
+def preprocess_chunks(
+    filepath: Union[str, Path],
+    chunk_size: int = CHUNK_SIZE,
+    mile_units: bool = True,
+    drop_col: bool = True,
+    engine: str = "columnar",
+) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV file in fixed-size chunks and preprocess them one by one,
+    so only a single chunk of raw data is held in memory at any time
+    :param filepath: location of the CSV file with original data
+    :param chunk_size: number of rows read at once. Defaults on CHUNK_SIZE
+    :param mile_units: whether to convert pace from miles
+    :param drop_col: whether to drop irrelevant columns for model
+    :param engine: "columnar" or "python". Defaults on "columnar"
+    :return: generator of Pandas DataFrames with preprocessed data
+    """
+    rows = 0
+    with pd.read_csv(filepath, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            df = preprocess_frame(chunk, mile_units, drop_col, engine)
+            # Chunks with only incomplete trainings are skipped to keep column types stable
+            if len(df):
+                rows += len(df)
+                yield df
+    logger.info(f"Preprocessing completed!!! ({rows} rows in chunks of {chunk_size})")
+
+
+def read_chunks(filepath: Union[str, Path], chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV or Parquet file in fixed-size chunks
+    :param filepath: location of the .csv or .parquet file
+    :param chunk_size: number of rows read at once. Defaults on CHUNK_SIZE
+    :return: generator of Pandas DataFrames
+    """
+    suffix = Path(filepath).suffix.lower()
+    if suffix == ".csv":
+        with pd.read_csv(filepath, chunksize=chunk_size) as reader:
+            yield from reader
+    elif suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(filepath).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported file type: {suffix}. Expected .csv or .parquet")
+
+
+def is_raw(df: pd.DataFrame) -> bool:
+    """
+    Check whether data comes straight from a Garmin export and needs preprocessing
+    :param df: Pandas DataFrame with data
+    :return: True when the data still has text columns or Garmin-only columns
+    """
+    return "Activity Type" in df.columns or any(df.dtypes == object)
+
+
+def _cache_slot(filepath: Union[str, Path], mile_units: bool, drop_col: bool) -> str:
+    """
+    Name shared by all cached versions of one file preprocessed with the same parameters
+    :param filepath: location of the CSV file with original data
+    :param mile_units: whether to convert pace from miles
+    :param drop_col: whether to drop irrelevant columns for model
+    :return: prefix of cache file names
+    """
+    # Files with the same name in different directories get different slots
+    location = hashlib.sha1(str(Path(filepath).resolve()).encode()).hexdigest()[:8]
+    units = "mi" if mile_units else "km"
+    columns = "model" if drop_col else "all"
+    return f"{Path(filepath).stem}_{location}_{units}_{columns}"
+
+
+def cached_dataset(
+    filepath: Union[str, Path], mile_units: bool = True, drop_col: bool = True
+) -> Path:
+    """
+    Locate the cached preprocessed dataset for the current file content and evict stale ones
+    :param filepath: location of the CSV file with original data
+    :param mile_units: whether to convert pace from miles
+    :param drop_col: whether to drop irrelevant columns for model
+    :return: location of the cache file, which exists only if the dataset is cached
+    """
+    slot = _cache_slot(filepath, mile_units, drop_col)
+    key = f"{utils.file_hash(filepath)[:16]}-v{PREPROCESS_VERSION}"
+    cache_fp = Path(config.PREPROCESSED_STORE, f"{slot}-{key}.parquet")
+
+    # Entries built from older file content or older code can never be hit again
+    for stale_fp in Path(config.PREPROCESSED_STORE).glob(f"{slot}-*.parquet"):
+        if stale_fp != cache_fp:
+            stale_fp.unlink(missing_ok=True)
+            logger.info(f"Evicted stale preprocessed dataset {stale_fp.name}")
+    return cache_fp
+
+
+def load_preprocessed(
+    filepath: Union[str, Path],
+    chunk_size: int = None,
+    mile_units: bool = True,
+    drop_col: bool = True,
+    engine: str = "columnar",
+    use_cache: bool = True,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """
+    Load a CSV file with original data and preprocess it
+    :param filepath: location of the CSV file with original data
+    :param chunk_size: if given, stream the file in chunks of this many rows and append
+    the preprocessed chunks, otherwise read the whole file at once. Defaults on None
+    :param mile_units: whether to convert pace from miles
+    :param drop_col: whether to drop irrelevant columns for model
+    :param engine: "columnar" or "python". Defaults on "columnar"
+    :param use_cache: whether to reuse the preprocessed dataset stored in
+    config.PREPROCESSED_STORE for the same file content and parameters. Defaults on True
+    :param compact: whether to downcast columns with DTYPE_PLAN. Defaults on False
+    :return: Pandas DataFrame with preprocessed data
+    """
+    if use_cache:
+        cache_fp = cached_dataset(filepath, mile_units, drop_col)
+        if cache_fp.exists():
+            logger.info(f"Loaded preprocessed dataset from cache {cache_fp.name}")
+            with profiling.phase("read_cache"):
+                df = pd.read_parquet(cache_fp)
+            log_memory_footprint("preprocessed data", df)
+            return compact_dtypes(df) if compact else df
+
+    if not chunk_size:
+        with profiling.phase("read_csv"):
+            df = pd.read_csv(filepath)
+        log_memory_footprint("raw data", df)
+        with profiling.phase("preprocess"):
+            df = preprocess(df, mile_units, drop_col, engine=engine)
+    else:
+        # Reading and preprocessing are interleaved chunk by chunk
+        with profiling.phase("read_preprocess_chunks"):
+            chunks = preprocess_chunks(filepath, chunk_size, mile_units, drop_col, engine)
+            df = pd.concat(chunks, ignore_index=True)
+
+    if use_cache:
+        # Write to a temporary file first, so readers never see a partial dataset
+        tmp_fp = cache_fp.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with profiling.phase("write_cache"):
+                df.to_parquet(tmp_fp)
+            os.replace(tmp_fp, cache_fp)
+        except (ValueError, TypeError, OSError) as err:
+            tmp_fp.unlink(missing_ok=True)
+            logger.warning(f"Preprocessed dataset was not cached: {err}")
+    log_memory_footprint("preprocessed data", df)
+    return compact_dtypes(df) if compact else df
+
+
+# Smallest data types holding every realistic value of the preprocessed columns
+DTYPE_PLAN = {
+    "Distance": np.float32,
+    "Calories": np.int16,
+    "Time": np.int32,
+    "Avg HR": np.int16,
+    "Avg Run Cadence": np.int16,
+    "Avg Pace": np.int16,
+    "Elev Gain": np.float32,
+    "Elev Loss": np.float32,
+}
+
+
+def compact_dtypes(df: pd.DataFrame, plan: Dict = None) -> pd.DataFrame:
+    """
+    Downcast preprocessed columns to smaller data types
+    :param df: Pandas DataFrame with preprocessed data
+    :param plan: mapping of column names to data types. Defaults on DTYPE_PLAN
+    :return: Pandas DataFrame with downcasted columns
+    """
+    plan = DTYPE_PLAN if plan is None else plan
+    df = df.copy()
+    for col, dtype in plan.items():
+        if col not in df.columns or not len(df):
+            continue
+        limits = np.iinfo(dtype) if np.issubdtype(dtype, np.integer) else np.finfo(dtype)
+        low, high = df[col].min(), df[col].max()
+        # Values out of range would silently wrap around or become infinite
+        if low < limits.min or high > limits.max:
+            raise ValueError(
+                f"Column '{col}' with values from {low} to {high} does not fit into {np.dtype(dtype)}"
+            )
+        df[col] = df[col].astype(dtype)
+    log_memory_footprint("compact data", df)
+    return df
+
+
+def memory_footprint(obj: Union[pd.DataFrame, np.ndarray, Tuple], deep: bool = True) -> int:
+    """
+    Number of bytes used by data
+    :param obj: Pandas DataFrame, NumPy array or tuple of them, e.g. Dataset
+    :param deep: whether to measure the strings of object columns, which visits every value.
+    Otherwise only their pointers are counted. Defaults on True
+    :return: size in bytes
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=deep).sum())
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    return sum(
+        memory_footprint(item, deep=deep)
+        for item in obj
+        if isinstance(item, (pd.DataFrame, np.ndarray))
+    )
+
+
+def log_memory_footprint(stage: str, obj: Union[pd.DataFrame, np.ndarray, Tuple]) -> None:
+    """
+    Log the memory used by data at a given stage. Object columns are measured deeply only
+    when the logger is at DEBUG level or a profiler is active, as it costs seconds on large data
+    :param stage: name of the processing stage
+    :param obj: Pandas DataFrame, NumPy array or tuple of them
+    """
+    deep = logger.isEnabledFor(logging.DEBUG) or profiling.is_active()
+    size = memory_footprint(obj, deep=deep) / 2**20
+    logger.info(f"Memory footprint of {stage}: {size:.2f} MiB" + ("" if deep else " (shallow)"))
+
+
 def drop_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
     Drop irrelevant columns for training model
@@ -143,6 +655,8 @@ def get_data_splits(
     :param val_set: whether create validation set. Defaults on False
     :return: data split as Pandas DataFrames and Series
     """
+    from sklearn.model_selection import train_test_split
+
     if val_set:
         X_train, X_, y_train, y_ = train_test_split(X, y, train_size=train_size)
         X_val, X_test, y_val, y_test = train_test_split(X_, y_, train_size=0.5)
@@ -159,14 +673,58 @@ def get_data_splits(
         return X_train.values, X_test.values, y_train.values, y_test.values
 
 
-def plots_transform(data: pd.DataFrame) -> pd.DataFrame:
+class Dataset(NamedTuple):
+    """Train, validation and test splits stored as contiguous read-only NumPy arrays"""
+
+    X_train: np.ndarray
+    X_val: np.ndarray
+    X_test: np.ndarray
+    y_train: np.ndarray
+    y_val: np.ndarray
+    y_test: np.ndarray
+    features: List[str]
+
+
+def prepare_dataset(
+    df: pd.DataFrame, train_size: float = 0.8, seed: int = 42, float32: bool = False
+) -> Dataset:
+    """
+    Split preprocessed data once, so it can be shared by many trainings
+    :param df: Pandas DataFrame with preprocessed data
+    :param train_size: size of the training set. Defaults on 0.8
+    :param seed: seed used for the split. Defaults on 42
+    :param float32: whether to store features as float32 and targets as float64, the types
+    the forest trains on, so fitting does not copy them. Defaults on False
+    :return: Dataset with train, validation and test splits
+    """
+    utils.set_seeds(seed)
+    X = df.drop("Calories", axis=1)
+    splits = get_data_splits(X, y=df["Calories"], train_size=train_size, val_set=True)
+    dtypes = [np.float32] * 3 + [np.float64] * 3 if float32 else [None] * 6
+    arrays = []
+    for split, dtype in zip(splits, dtypes):
+        array = np.ascontiguousarray(split, dtype=dtype)
+        # Every training reuses the same arrays, none of them may modify it
+        array.setflags(write=False)
+        arrays.append(array)
+    dataset = Dataset(*arrays, features=X.columns.tolist())
+    log_memory_footprint("data splits", dataset)
+    return dataset
+
+
+def plots_transform(
+    data: pd.DataFrame, engine: str = "columnar", preprocessed: bool = False
+) -> pd.DataFrame:
     """
     Transforming data to create charts
     :param data: Pandas DataFrame with data
+    :param engine: preprocess engine, "columnar" or "python". Defaults on "columnar"
+    :param preprocessed: whether data was already preprocessed with drop_col=False.
+    Defaults on False
     :return: Transformed dataFrame with new
     """
 
-    df = preprocess(data, True, False)
+    df = data if preprocessed else preprocess(data, True, False, engine=engine)
     df = df.sort_values(by=["Avg Pace"])
     bins = np.arange(150, 421, 15)
     df["Pace Range"] = pd.cut(x=df["Avg Pace"], bins=bins, retbins=False)
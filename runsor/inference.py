@@ -0,0 +1,233 @@
+import json
+import weakref
+from pathlib import Path
+from typing import TYPE_CHECKING, Union
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import RandomForestRegressor
+
+# Number of rows traversed at once, bounds the memory of the node index matrix
+BATCH_SIZE = 4096
+
+# Version of the on-disk forest format
+FOREST_FORMAT_VERSION = 1
+# Node arrays stored as separate .npy files
+FOREST_ARRAYS = ["feature", "threshold", "left", "right", "value", "roots"]
+
+# Forests already flattened, dropped together with their models
+_compiled = weakref.WeakKeyDictionary()
+
+
+def float32_thresholds(threshold: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 not above every threshold. Inputs are compared as float32, so a float32
+    input is <= the threshold exactly when it is <= this value, while the nearest float32
+    could round a threshold up and send inputs just above it to the left child.
+    :param threshold: float64 thresholds of the nodes
+    :return: float32 thresholds splitting float32 inputs like the float64 ones
+    """
+    threshold32 = np.asarray(threshold).astype(np.float32)
+    above = threshold32 > threshold
+    threshold32[above] = np.nextafter(threshold32[above], np.float32(-np.inf))
+    return threshold32
+
+
+class FlatForest:
+    """
+    Random forest exported to flat NumPy node arrays.
+    Nodes of all trees are concatenated and every leaf points to itself, so a batch of rows is
+    routed through all trees at once by repeating a single vectorized step until all rows
+    reach a leaf.
+    Predictions are bit for bit equal to RandomForestRegressor.predict.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        n_features: int,
+    ):
+        """
+        :param feature: feature compared at each node, 0 for leaves
+        :param threshold: threshold of each node, going left when value <= threshold
+        :param left: index of the left child, the node itself for leaves
+        :param right: index of the right child, the node itself for leaves
+        :param value: predicted value of each node
+        :param roots: index of the root node of each tree
+        :param max_depth: depth of the deepest tree
+        :param n_features: number of features the forest was trained on
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+
+    @classmethod
+    def from_model(cls, model: "RandomForestRegressor") -> "FlatForest":
+        """
+        Export a trained forest
+        :param model: fitted single output RandomForestRegressor
+        :return: flattened forest
+        """
+        if not hasattr(model, "estimators_"):
+            raise ValueError("Model is not fitted")
+        if model.n_outputs_ != 1:
+            raise ValueError(f"Expected a single output model, got {model.n_outputs_} outputs")
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        feature, threshold, left, right = [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count) + offset
+            leaf = tree.children_left == -1
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            left.append(np.where(leaf, nodes, tree.children_left + offset))
+            right.append(np.where(leaf, nodes, tree.children_right + offset))
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            left=np.concatenate(left).astype(np.intp),
+            right=np.concatenate(right).astype(np.intp),
+            value=np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64),
+            roots=offsets.astype(np.intp),
+            max_depth=max(tree.max_depth for tree in trees),
+            n_features=model.n_features_in_,
+        )
+
+    def save(self, directory: Union[str, Path], float32: bool = False) -> Path:
+        """
+        Store the node arrays as uncompressed .npy files, so they can be memory mapped
+        :param directory: location of the forest directory, created when missing
+        :param float32: whether to halve thresholds and values to float32. Every row still
+            reaches the same leaves, only the leaf values are rounded. Defaults to False
+        :return: location of the forest directory
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        float_dtype = np.float32 if float32 else np.float64
+        # Node indices fit in int32 for any forest that fits in memory
+        dtypes = {
+            "feature": np.int32,
+            "threshold": float_dtype,
+            "left": np.int32,
+            "right": np.int32,
+            "value": float_dtype,
+            "roots": np.int32,
+        }
+        arrays = {name: getattr(self, name) for name in dtypes}
+        if float32:
+            arrays["threshold"] = float32_thresholds(self.threshold)
+        for name, dtype in dtypes.items():
+            np.save(Path(directory, f"{name}.npy"), np.ascontiguousarray(arrays[name], dtype))
+        meta = {
+            "version": FOREST_FORMAT_VERSION,
+            "max_depth": int(self.max_depth),
+            "n_features": int(self.n_features),
+            "n_trees": int(self.n_trees),
+            "float32": float32,
+        }
+        with open(Path(directory, "meta.json"), "w") as file:
+            json.dump(meta, file, indent=2)
+            file.write("\n")
+        return directory
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], mmap: bool = True) -> "FlatForest":
+        """
+        Load a forest stored with FlatForest.save
+        :param directory: location of the forest directory
+        :param mmap: whether to memory map the arrays read-only, so processes loading the same
+            forest share its pages. Defaults to True
+        :return: flattened forest
+        """
+        with open(Path(directory, "meta.json")) as file:
+            meta = json.load(file)
+        if meta["version"] != FOREST_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported forest format version: {meta['version']}, "
+                f"expected {FOREST_FORMAT_VERSION}"
+            )
+        arrays = {
+            name: np.load(Path(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in FOREST_ARRAYS
+        }
+        return cls(**arrays, max_depth=meta["max_depth"], n_features=meta["n_features"])
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """
+        Find the leaf reached in every tree
+        :param X: float32 NumPy array with rows to predict
+        :return: NumPy array of shape (n_trees, n_rows) with leaf indices
+        """
+        rows = np.tile(np.arange(len(X)), self.n_trees)
+        nodes = np.repeat(self.roots, len(X))
+        # Positions of rows still travelling down, leaves are dropped after every step
+        active = np.arange(len(nodes))
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            # Same comparison as sklearn, float32 input against float64 threshold
+            go_left = X[rows[active], self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[self.left[nodes[active]] != nodes[active]]
+            if not len(active):
+                break
+        return nodes.reshape(self.n_trees, len(X))
+
+    def predict(
+        self, X: Union[np.ndarray, pd.DataFrame], batch_size: int = BATCH_SIZE
+    ) -> np.ndarray:
+        """
+        Predict values for the rows
+        :param X: NumPy array or Pandas DataFrame with rows to predict
+        :param batch_size: number of rows traversed at once. Defaults to BATCH_SIZE
+        :return: NumPy array with predictions
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(
+                f"Invalid input shape: {X.shape}, expected (n_rows, {self.n_features})"
+            )
+        predictions = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), batch_size):
+            stop = start + batch_size
+            values = self.value[self.leaves(X[start:stop])]
+            # Trees are summed one after another, in the order used by sklearn
+            total = np.zeros(values.shape[1], dtype=np.float64)
+            for tree_values in values:
+                total += tree_values
+            predictions[start:stop] = total / self.n_trees
+        return predictions
+
+
+def compile_forest(model: "RandomForestRegressor") -> FlatForest:
+    """
+    Flatten a forest once and reuse it for the following calls with the same model
+    :param model: fitted RandomForestRegressor, a FlatForest is returned as it is
+    :return: flattened forest
+    """
+    if isinstance(model, FlatForest):
+        return model
+    forest = _compiled.get(model)
+    if forest is None:
+        forest = FlatForest.from_model(model)
+        _compiled[model] = forest
+    return forest
@@ -1,25 +1,46 @@
 import json
 import tempfile
+import time
 from argparse import Namespace
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import TYPE_CHECKING, Union
 
-import joblib
-import mlflow
-import optuna
 import pandas as pd
 import typer
 from numpyencoder import NumpyEncoder
-from optuna.integration.mlflow import MLflowCallback
 
 from config import config
 from config.config import logger
-from runsor import predict, train, utils
+from runsor import data, inference, predict, profiling, utils
+from runsor.artifacts import (  # noqa: F401
+    ARTIFACT_CACHE,
+    MODEL_FORMATS,
+    load_artifacts,
+    predict_value,
+    promote_bundle,
+    save_bundle,
+)
+
+# MLflow, Optuna, scikit-learn and PyArrow are imported by the commands using them,
+# so the CLI starts quickly and modules importing this one do not pay for them
+if TYPE_CHECKING:
+    import optuna
 
 # Initialize Typer CLI app
 app = typer.Typer()
 
 
+@app.callback()
+def init() -> None:
+    """
+    Train, optimize and run the calories prediction model
+    """
+    # Runs before every command
+    config.init()
+
+
 @app.command()
 def el_data() -> None:
     """
@@ -39,6 +60,13 @@ def train_model(
     experiment_name: str = "baselines",
     run_name: str = "rnd_reg",
     test_run: bool = False,
+    chunk_size: int = None,
+    cache: bool = True,
+    validation: str = "holdout",
+    compact: bool = False,
+    float32: bool = False,
+    forest_float32: bool = False,
+    profile: bool = False,
 ) -> None:
     """
     Train a model with given hyperparameters
@@ -46,63 +74,258 @@ def train_model(
     :param experiment_name: name of an experiment
     :param test_run: If True, artifacts will not be saved. Defaults to False
     :param run_name: name of specifies run in experiment
+    :param chunk_size: if given, read and preprocess the data in chunks of this many rows
+    :param cache: whether to reuse the cached preprocessed dataset. Defaults to True
+    :param validation: "holdout" or "oob" validation loss. Defaults to "holdout"
+    :param compact: whether to downcast preprocessed columns with data.DTYPE_PLAN.
+    Defaults to False
+    :param float32: whether to train the forest on float32 arrays. Defaults to False
+    :param forest_float32: whether to store thresholds and values of the flat forest artifact
+    as float32. Defaults to False
+    :param profile: whether to log wall time, CPU time, peak memory and a cProfile report
+    of every phase into the run. Defaults to False
     """
-    # Load data
-    df = pd.read_csv(Path(config.DATA_DIR, "activity_log.csv"))
-
-    # Train
-    args = Namespace(**utils.load_dict(filepath=args_fp))
-    mlflow.set_experiment(experiment_name=experiment_name)
-    with mlflow.start_run(run_name=run_name):
-        run_id = mlflow.active_run().info.run_id
-        artifacts = train.train(df=df, args=args)
-        performance = artifacts["performance"]
-        logger.info(json.dumps(performance, indent=2))
-
-        # Log metrics and parameters
-        mlflow.log_metrics({"MSE": performance["MSE"]})
-        mlflow.log_metrics({"RMSE": performance["RMSE"]})
-        mlflow.log_metrics({"MAE": performance["MAE"]})
-        mlflow.log_params(vars(artifacts["args"]))
-
-        # Log artifacts
-        with tempfile.TemporaryDirectory() as dp:
-            utils.save_dict(vars(artifacts["args"]), Path(dp, "args.json"), cls=NumpyEncoder)
-            joblib.dump(artifacts["model"], Path(dp, "model.pkl"))
-            utils.save_dict(performance, Path(dp, "performance.json"))
-            mlflow.log_artifacts(dp)
-
-        if not test_run:
-            # Save to config
-            open(Path(config.CONFIG_DIR, "run_id.txt"), "w").write(run_id)
-            utils.save_dict(performance, Path(config.CONFIG_DIR, "performance.json"))
+    import joblib
+    import mlflow
+
+    from runsor import train
+
+    train.check_validation(validation)
+
+    with profiling.Profiler(enabled=profile) as profiler:
+        # Load data
+        df = data.load_preprocessed(
+            Path(config.DATA_DIR, "activity_log.csv"),
+            chunk_size=chunk_size,
+            use_cache=cache,
+            compact=compact,
+        )
+        with profiling.phase("split"):
+            dataset = data.prepare_dataset(df, float32=float32)
+
+        # Train
+        args = Namespace(**utils.load_dict(filepath=args_fp))
+        mlflow.set_experiment(experiment_name=experiment_name)
+        with mlflow.start_run(run_name=run_name):
+            run_id = mlflow.active_run().info.run_id
+            artifacts = train.train(df=df, args=args, dataset=dataset, validation=validation)
+            performance = artifacts["performance"]
+            logger.info(json.dumps(performance, indent=2))
+
+            # Log metrics and parameters
+            mlflow.log_metrics({"MSE": performance["MSE"]})
+            mlflow.log_metrics({"RMSE": performance["RMSE"]})
+            mlflow.log_metrics({"MAE": performance["MAE"]})
+            mlflow.log_params(vars(artifacts["args"]))
+
+            # Log artifacts
+            with profiling.phase("log_artifacts"), tempfile.TemporaryDirectory() as dp:
+                utils.save_dict(vars(artifacts["args"]), Path(dp, "args.json"), cls=NumpyEncoder)
+                joblib.dump(artifacts["model"], Path(dp, "model.pkl"))
+                inference.FlatForest.from_model(artifacts["model"]).save(
+                    Path(dp, "forest"), float32=forest_float32
+                )
+                utils.save_dict(performance, Path(dp, "performance.json"))
+                bundle_fp = save_bundle(
+                    Path(dp, "bundle.tar"),
+                    artifacts,
+                    run_id,
+                    features=dataset.features,
+                    dtype=str(dataset.X_train.dtype),
+                )
+                mlflow.log_artifacts(dp)
+                if not test_run:
+                    # Bundle is in place before run_id.txt points the service at the run
+                    promote_bundle(bundle_fp)
+            profiler.log_to_mlflow()
+
+            if not test_run:
+                # Save to config
+                open(Path(config.CONFIG_DIR, "run_id.txt"), "w").write(run_id)
+                utils.save_dict(performance, Path(config.CONFIG_DIR, "performance.json"))
 
 
 @app.command()
-def optimize(
-    args_fp: str = "config/args.json", study_name: str = "optimization", num_trials: int = 20
+def bundle_run(run_id: str = None, float32: bool = False) -> None:
+    """
+    Build the serving bundle of a run from its artifacts in the model registry and promote it,
+    for runs trained before train-model saved bundles
+    :param run_id: id of the run. Defaults to the run in config/run_id.txt
+    :param float32: whether the run was trained on float32 arrays. Defaults to False
+    """
+    if not run_id:
+        run_id = open(Path(config.CONFIG_DIR, "run_id.txt")).read().strip()
+    artifacts = load_artifacts(run_id, use_cache=False)
+    # Models are fitted on arrays, the features are in the order of the training data
+    df = data.load_preprocessed(Path(config.DATA_DIR, "activity_log.csv"))
+    features = df.drop("Calories", axis=1).columns.tolist()
+    with tempfile.TemporaryDirectory() as dp:
+        bundle_fp = save_bundle(
+            Path(dp, "bundle.tar"),
+            artifacts,
+            run_id,
+            features=features,
+            dtype="float32" if float32 else "float64",
+        )
+        promote_bundle(bundle_fp)
+    logger.info(f"Serving run {run_id} from {config.SERVING_BUNDLE}")
+
+
+def _study_storage(study_name: str) -> "optuna.storages.JournalStorage":
+    """
+    File-backed storage shared by all processes working on a study
+    :param study_name: name of optimization study
+    :return: Optuna storage
+    """
+    import optuna
+
+    storage_fp = Path(config.OPTUNA_STORE, f"{study_name}.log")
+    return optuna.storages.JournalStorage(optuna.storages.JournalFileStorage(str(storage_fp)))
+
+
+def _run_trials(
+    study_name: str,
+    args: Namespace,
+    dataset: data.Dataset,
+    num_trials: int,
+    seed: int,
+    validation: str = "holdout",
 ) -> None:
     """
-    Optimize hyperparameters.
-    :param args_fp: location of arguments
+    Run trials of a stored study, in the current process or in a worker of the pool
     :param study_name: name of optimization study
+    :param args: arguments to use for training
+    :param dataset: data splits shared by all trials
     :param num_trials: number of trials to run
+    :param seed: seed of the sampler, distinct for every worker
+    :param validation: "holdout" or "oob" validation loss. Defaults to "holdout"
     """
-    # Load data
-    df = pd.read_csv(Path(config.DATA_DIR, "activity_log.csv"))
+    import mlflow
+    import optuna
+    from optuna.integration.mlflow import MLflowCallback
+
+    from runsor import train
 
-    # Optimize
-    args = Namespace(**utils.load_dict(filepath=args_fp))
     pruner = optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=5)
-    study = optuna.create_study(study_name=study_name, direction="minimize", pruner=pruner)
+    study = optuna.load_study(
+        study_name=study_name,
+        storage=_study_storage(study_name),
+        sampler=optuna.samplers.TPESampler(seed=seed),
+        pruner=pruner,
+    )
     mlflow_callback = MLflowCallback(tracking_uri=mlflow.get_tracking_uri(), metric_name="RMSE")
     study.optimize(
-        lambda trial: train.objective(args, df, trial),
+        lambda trial: train.objective(args, None, trial, dataset=dataset, validation=validation),
         n_trials=num_trials,
         callbacks=[mlflow_callback],
     )
 
+
+@app.command()
+def optimize(
+    args_fp: str = "config/args.json",
+    study_name: str = "optimization",
+    num_trials: int = 20,
+    chunk_size: int = None,
+    cache: bool = True,
+    n_workers: int = 1,
+    resume: bool = False,
+    seed: int = 42,
+    validation: str = "holdout",
+    compact: bool = False,
+    float32: bool = False,
+    profile: bool = False,
+) -> None:
+    """
+    Optimize hyperparameters.
+    :param args_fp: location of arguments
+    :param study_name: name of optimization study
+    :param num_trials: number of trials to run
+    :param chunk_size: if given, read and preprocess the data in chunks of this many rows
+    :param cache: whether to reuse the cached preprocessed dataset. Defaults to True
+    :param n_workers: number of processes running trials in parallel. Defaults to 1
+    :param resume: continue the stored study with the same name until it has num_trials
+    finished trials, instead of starting a new one. Defaults to False
+    :param seed: seed of the sampler, worker i uses seed + i. Defaults to 42
+    :param validation: "holdout" or "oob" validation loss reported to the pruner.
+    Defaults to "holdout"
+    :param compact: whether to downcast preprocessed columns with data.DTYPE_PLAN.
+    Defaults to False
+    :param float32: whether to train the forest on float32 arrays. Defaults to False
+    :param profile: whether to log wall time, CPU time, peak memory and a cProfile report
+    of every phase into the run {study_name}_profile, phases of trials are summed and only
+    profiled when n_workers is 1. Defaults to False
+    """
+    import mlflow
+    import optuna
+
+    from runsor import train
+
+    # Invalid options fail before the data is read
+    if n_workers < 1:
+        raise ValueError(f"Invalid number of workers: {n_workers}, expected at least 1")
+    train.check_validation(validation)
+
+    with profiling.Profiler(enabled=profile) as profiler:
+        # Load data
+        df = data.load_preprocessed(
+            Path(config.DATA_DIR, "activity_log.csv"),
+            chunk_size=chunk_size,
+            use_cache=cache,
+            compact=compact,
+        )
+
+        # Split once, every trial fits on the same arrays
+        with profiling.phase("split"):
+            dataset = data.prepare_dataset(df, float32=float32)
+
+        # Study is stored in a file, so workers can share it and an interrupted one can be resumed
+        if not resume:
+            Path(config.OPTUNA_STORE, f"{study_name}.log").unlink(missing_ok=True)
+        study = optuna.create_study(
+            study_name=study_name,
+            storage=_study_storage(study_name),
+            direction="minimize",
+            load_if_exists=True,
+        )
+        finished = study.get_trials(
+            deepcopy=False,
+            states=[optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED],
+        )
+        remaining = max(num_trials - len(finished), 0)
+        logger.info(f"Running {remaining} trials of study {study_name} on {n_workers} workers")
+
+        # Optimize
+        args = Namespace(**utils.load_dict(filepath=args_fp))
+        if n_workers == 1:
+            _run_trials(study_name, args, dataset, remaining, seed, validation)
+        else:
+            # Experiment is created up front, so workers do not race to create it
+            mlflow.set_experiment(experiment_name=study_name)
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = [
+                    executor.submit(
+                        _run_trials,
+                        study_name,
+                        args,
+                        dataset,
+                        remaining // n_workers + (worker < remaining % n_workers),
+                        seed + worker,
+                        validation,
+                    )
+                    for worker in range(n_workers)
+                ]
+                for future in futures:
+                    future.result()
+
+        if profile:
+            mlflow.set_experiment(experiment_name=study_name)
+            with mlflow.start_run(run_name=f"{study_name}_profile"):
+                mlflow.log_params({"num_trials": remaining, "n_workers": n_workers})
+                profiler.log_to_mlflow()
+
     # Best trial
+    study = optuna.load_study(study_name=study_name, storage=_study_storage(study_name))
     trails_df = study.trials_dataframe()
     trails_df = trails_df.sort_values(["user_attrs_RMSE"], ascending=False)
     # Save best parameter values
@@ -112,49 +335,127 @@ def optimize(
     logger.info(f"Best hyperparameters: {json.dumps(study.best_trial.params, indent=2)}")
 
 
-def load_artifacts(run_id: str = None) -> Dict:
+# Artifacts loaded once by every scoring worker
+_worker_artifacts = None
+
+
+def _init_scoring_worker(run_id: str, model_format: str) -> None:
     """
-    Load artifacts for a given run_id
-    :param run_id: id of run to load artifacts from. Defaults as None.
-    :return: Dictionary with run's artifacts
+    Load the model in a scoring worker
+    :param run_id: id of the run to score with
+    :param model_format: "pickle" or "flat"
     """
-    if not run_id:
-        run_id = open(Path(config.CONFIG_DIR, "run_id.txt")).read()
-
-    # Locate specifics artifacts directory
-    experiment_id = mlflow.get_run(run_id=run_id).info.experiment_id
-    artifacts_dir = Path(config.MODEL_REGISTRY, experiment_id, run_id, "artifacts")
+    global _worker_artifacts
+    _worker_artifacts = load_artifacts(run_id, model_format=model_format)
 
-    # Load objects from run
-    args = Namespace(**utils.load_dict(filepath=Path(artifacts_dir, "args.json")))
-    model = joblib.load(Path(artifacts_dir, "model.pkl"))
-    performance = utils.load_dict(filepath=Path(artifacts_dir, "performance.json"))
 
-    return {"args": args, "model": model, "performance": performance}
+def _score_chunk(chunk: pd.DataFrame, engine: str = "sklearn") -> pd.DataFrame:
+    """
+    Preprocess a chunk when needed and predict its calories
+    :param chunk: Pandas DataFrame with raw or preprocessed runs
+    :param engine: "sklearn" or "flat" prediction engine. Defaults to "sklearn"
+    :return: Pandas DataFrame with the model features and the "Predicted Calories" column
+    """
+    if data.is_raw(chunk):
+        chunk = data.preprocess_frame(chunk)
+    if not len(chunk):
+        return chunk.assign(**{"Predicted Calories": pd.Series(dtype=int)})
+    predictions = predict.predict(
+        chunk, _worker_artifacts, shape="columns", engine=engine, use_cache=False
+    )
+    return chunk.assign(**{"Predicted Calories": predictions["predicted_calories"]})
 
 
-def predict_value(data: Union[Dict, pd.DataFrame], run_id: str = None) -> List:
+class _ResultWriter:
     """
-    Predict calories burned during the run
-    :param data: Input dictionary or pandas DataFrame to predict calories
-    :param run_id: run id to load artifacts for prediction. Defaults on None
-    :return:
+    Append scored chunks to a CSV or Parquet file
     """
-    if isinstance(data, Dict):
-        key = list(data.keys())[0]
-        if type(data[key]) == list:
-            df = pd.DataFrame(data)
+
+    def __init__(self, filepath: Union[str, Path]):
+        self.filepath = Path(filepath)
+        if self.filepath.suffix.lower() not in [".csv", ".parquet"]:
+            raise ValueError(
+                f"Unsupported file type: {self.filepath.suffix}. Expected .csv or .parquet"
+            )
+        self.rows = 0
+        self._parquet = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if not len(df):
+            return
+        if self.filepath.suffix.lower() == ".csv":
+            df.to_csv(
+                self.filepath, mode="a" if self.rows else "w", header=not self.rows, index=False
+            )
         else:
-            df = pd.DataFrame(data, index=[0])
-    elif isinstance(data, pd.DataFrame):
-        df = data
-    else:
-        raise ValueError("Invalid input data type. Expected dictionary of pandas DataFrame")
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.filepath, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+        self.rows += len(df)
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+@app.command()
+def predict_file(
+    input_fp: str,
+    output_fp: str,
+    run_id: str = None,
+    chunk_size: int = data.CHUNK_SIZE,
+    n_workers: int = 1,
+    model_format: str = "pickle",
+    engine: str = "sklearn",
+) -> None:
+    """
+    Score a CSV or Parquet file of runs in chunks, raw Garmin exports are preprocessed first
+    :param input_fp: filepath to the .csv or .parquet file with runs
+    :param output_fp: filepath to the .csv or .parquet file with predictions, written chunk by chunk
+    :param run_id: id of the run to score with. Defaults to config/run_id.txt
+    :param chunk_size: number of rows scored at once. Defaults to data.CHUNK_SIZE
+    :param n_workers: number of processes scoring chunks, each loads the model once. Defaults to 1
+    :param model_format: "pickle" or "flat" model artifact. Defaults to "pickle"
+    :param engine: "sklearn" or "flat" prediction engine. Defaults to "sklearn"
+    """
     if not run_id:
         run_id = open(Path(config.CONFIG_DIR, "run_id.txt")).read()
-    artifacts = load_artifacts(run_id)
-    prediction = predict.predict(data=df, artifacts=artifacts)
-    return prediction
+    start = time.perf_counter()
+    writer = _ResultWriter(output_fp)
+    chunks = data.read_chunks(input_fp, chunk_size)
+    read = 0
+    try:
+        if n_workers == 1:
+            _init_scoring_worker(run_id, model_format)
+            for chunk in chunks:
+                read += len(chunk)
+                writer.write(_score_chunk(chunk, engine))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_scoring_worker,
+                initargs=(run_id, model_format),
+            ) as executor:
+                # Few chunks in flight keep memory bounded, results are written in input order
+                pending: deque[Future] = deque()
+                for chunk in chunks:
+                    read += len(chunk)
+                    pending.append(executor.submit(_score_chunk, chunk, engine))
+                    if len(pending) >= 2 * n_workers:
+                        writer.write(pending.popleft().result())
+                while pending:
+                    writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - start
+    logger.info(
+        f"Scored {writer.rows} of {read} rows in {seconds:.2f} s "
+        f"({read / seconds:.0f} rows/s) with {n_workers} workers, saved to {output_fp}"
+    )
 
 
 if __name__ == "__main__":
@@ -1,26 +1,184 @@
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
+from config import config
+from runsor import inference, utils
 
-def predict(data: pd.DataFrame, artifacts: Dict) -> List:
-    """Predict tags for given texts.
+# Layouts of the predictions
+PREDICTION_SHAPES = ["rows", "columns"]
+# Implementations evaluating the forest
+PREDICTION_ENGINES = ["sklearn", "flat"]
+
+# Predictions of single runs, keyed by (cache_scope, features)
+PREDICTION_CACHE = utils.LRUCache(
+    maxsize=config.PREDICTION_CACHE_SIZE, ttl=config.PREDICTION_CACHE_TTL
+)
+
+
+def predict(
+    data: pd.DataFrame,
+    artifacts: Dict,
+    shape: str = "rows",
+    engine: str = "sklearn",
+    use_cache: bool = True,
+) -> Union[List, Dict]:
+    """Predict calories burned during given runs.
 
     Args:
         data: Pandas DataFrame with data to predict.
         artifacts: Artifacts from a run.
+        shape: "rows" for a list with a dictionary per run,
+            "columns" for a dictionary with a list of predictions. Defaults to "rows".
+        engine: "sklearn" for the model's own predict, "flat" for the flattened forest
+            from runsor.inference, faster for small batches. Defaults to "sklearn".
+        use_cache: whether to reuse predictions of runs seen before with the same artifacts
+            and engine, batches larger than config.PREDICTION_CACHE_MAX_ROWS are never cached.
+            Defaults to True.
 
     Returns:
-        List: predictions for input data.
+        List or Dict: predictions for input data.
     """
+    if shape not in PREDICTION_SHAPES:
+        raise ValueError(f"Invalid prediction shape: {shape}, expected one of {PREDICTION_SHAPES}")
+    if engine not in PREDICTION_ENGINES:
+        raise ValueError(
+            f"Invalid prediction engine: {engine}, expected one of {PREDICTION_ENGINES}"
+        )
     if "Calories" in data.columns:
         data = data.drop("Calories", axis=1)
-    calories = artifacts["model"].predict(data.values)
-    predictions = [
-        {
-            "input_data": data.iloc[i].values.tolist(),
-            "predicted_calories": int(calories[i]),
-        }
-        for i in range(len(calories))
+    values = data.values
+    model = artifacts["model"]
+    if engine == "flat":
+        model = inference.compile_forest(model)
+    calories = predict_values(values, artifacts, model.predict, use_cache=use_cache, engine=engine)
+    return format_predictions(values, calories, shape=shape)
+
+
+def cache_scope(artifacts: Dict, engine: str = "sklearn") -> Optional[Tuple]:
+    """Identify the model making predictions, so a reloaded model or another engine never
+    gets predictions cached for a different one.
+
+    Args:
+        artifacts: Artifacts from a run.
+        engine: implementation evaluating the forest, one of PREDICTION_ENGINES.
+            Defaults to "sklearn".
+
+    Returns:
+        Tuple: run_id, signature of the loaded artifacts and engine,
+            None when the artifacts hold no run_id and predictions are not cached.
+    """
+    run_id = artifacts.get("run_id")
+    if run_id is None:
+        return None
+    return run_id, artifacts.get("signature"), engine
+
+
+def cacheable(values: np.ndarray) -> bool:
+    """Check whether predictions of feature rows go through PREDICTION_CACHE.
+
+    Looking up and storing every row of a large batch costs more than the model call saves
+    and evicts the single runs the cache is for.
+
+    Args:
+        values: NumPy array with the features of the runs.
+
+    Returns:
+        bool: True for at most config.PREDICTION_CACHE_MAX_ROWS rows.
+    """
+    return len(values) <= config.PREDICTION_CACHE_MAX_ROWS
+
+
+def _cache_keys(values: np.ndarray, scope: Tuple) -> List[Tuple]:
+    """Normalized cache keys of feature rows, integers and floats of equal value share a key."""
+    return [(scope, tuple(row)) for row in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def cached_predictions(values: np.ndarray, scope: Tuple) -> Tuple[np.ndarray, List[int]]:
+    """Look up predictions of runs in PREDICTION_CACHE.
+
+    Args:
+        values: NumPy array with the features of the runs.
+        scope: model making the predictions, from cache_scope.
+
+    Returns:
+        Tuple: NumPy array with cached predictions, NaN for the other runs,
+            and a list of positions of runs which are not cached.
+    """
+    calories = np.full(len(values), np.nan)
+    missing = []
+    for i, key in enumerate(_cache_keys(values, scope)):
+        value = PREDICTION_CACHE.get(key)
+        if value is None:
+            missing.append(i)
+        else:
+            calories[i] = value
+    return calories, missing
+
+
+def cache_predictions(values: np.ndarray, calories: np.ndarray, scope: Tuple) -> None:
+    """Store predictions of runs in PREDICTION_CACHE.
+
+    Args:
+        values: NumPy array with the features of the runs.
+        calories: NumPy array with the predictions.
+        scope: model making the predictions, from cache_scope.
+    """
+    for key, value in zip(_cache_keys(values, scope), np.asarray(calories).tolist()):
+        PREDICTION_CACHE.put(key, value)
+
+
+def predict_values(
+    values: np.ndarray,
+    artifacts: Dict,
+    predict_fn: Callable[[np.ndarray], np.ndarray] = None,
+    use_cache: bool = True,
+    engine: str = "sklearn",
+) -> np.ndarray:
+    """Predict calories for feature rows, evaluating the model only for runs not cached.
+
+    Args:
+        values: NumPy array with the features of the runs.
+        artifacts: Artifacts from a run, predictions are cached only when they hold a run_id.
+        predict_fn: function predicting the rows. Defaults to the model's predict.
+        use_cache: whether to use PREDICTION_CACHE, only for batches which are cacheable.
+            Defaults to True.
+        engine: implementation behind predict_fn, one of PREDICTION_ENGINES.
+            Defaults to "sklearn".
+
+    Returns:
+        np.ndarray: predictions for input data.
+    """
+    predict_fn = predict_fn or artifacts["model"].predict
+    scope = cache_scope(artifacts, engine)
+    if not use_cache or scope is None or not cacheable(values):
+        return predict_fn(values)
+    calories, missing = cached_predictions(values, scope)
+    if missing:
+        calories[missing] = predict_fn(values[missing])
+        cache_predictions(values[missing], calories[missing], scope)
+    return calories
+
+
+def format_predictions(
+    values: np.ndarray, calories: np.ndarray, shape: str = "rows"
+) -> Union[List, Dict]:
+    """Build the response for predicted runs.
+
+    Args:
+        values: NumPy array with the features of the runs.
+        calories: NumPy array with the predictions.
+        shape: "rows" or "columns", see predict. Defaults to "rows".
+
+    Returns:
+        List or Dict: predictions for input data.
+    """
+    # Converting whole arrays to lists is much faster than converting row by row
+    calories = np.asarray(calories).astype(int).tolist()
+    if shape == "columns":
+        return {"predicted_calories": calories}
+    return [
+        {"input_data": input_data, "predicted_calories": predicted}
+        for input_data, predicted in zip(values.tolist(), calories)
     ]
-    return predictions
@@ -0,0 +1,187 @@
+import cProfile
+import io
+import os
+import platform
+import pstats
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Union
+
+from config.config import logger
+from runsor import utils
+
+# Number of functions listed in the text report of every phase
+REPORT_LINES = 30
+
+# Profiler collecting the phases, None when profiling is disabled
+_active = None
+
+
+class Profiler:
+    """
+    Collect wall time, CPU time, peak memory and a cProfile profile of named phases.
+    Phases with the same name are accumulated, so phases repeated in every trial are summed,
+    and phases started inside another phase are part of the outer one.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        :param enabled: whether to collect anything, a disabled profiler does nothing.
+            Defaults to True
+        """
+        self.enabled = enabled
+        self.phases = {}
+        self._wall_seconds = 0.0
+        self._current = None
+        self._start = None
+
+    @property
+    def wall_seconds(self) -> float:
+        """Time spent inside the profiler, up to now when it is still active."""
+        if self._start is None:
+            return self._wall_seconds
+        return self._wall_seconds + time.perf_counter() - self._start
+
+    def __enter__(self) -> "Profiler":
+        global _active
+        if not self.enabled:
+            return self
+        if _active is not None:
+            raise RuntimeError("Another profiler is already active")
+        tracemalloc.start()
+        self._start = time.perf_counter()
+        _active = self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active
+        if not self.enabled:
+            return
+        _active = None
+        self._wall_seconds, self._start = self.wall_seconds, None
+        tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measure a phase
+        :param name: name of the phase
+        :return:
+        """
+        if self._current is not None:
+            yield
+            return
+        stats = self.phases.setdefault(
+            name,
+            {
+                "calls": 0,
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "peak_memory_mib": 0.0,
+                "profile": cProfile.Profile(),
+            },
+        )
+        self._current = name
+        tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        stats["profile"].enable()
+        try:
+            yield
+        finally:
+            stats["profile"].disable()
+            stats["calls"] += 1
+            stats["wall_seconds"] += time.perf_counter() - wall
+            stats["cpu_seconds"] += time.process_time() - cpu
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            stats["peak_memory_mib"] = max(stats["peak_memory_mib"], peak)
+            self._current = None
+
+    def summary(self) -> Dict:
+        """
+        Measurements of all phases
+        :return: dictionary with the phases and the machine they ran on
+        """
+        phases = {
+            name: {key: value for key, value in stats.items() if key != "profile"}
+            for name, stats in self.phases.items()
+        }
+        return {
+            "wall_seconds": self.wall_seconds,
+            "phases": phases,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        }
+
+    def metrics(self) -> Dict:
+        """
+        Flat metrics with the same names in every run
+        :return: dictionary with a metric per phase and measurement
+        """
+        metrics = {"profile_wall_seconds": self.wall_seconds}
+        for name, stats in self.summary()["phases"].items():
+            for key in ["wall_seconds", "cpu_seconds", "peak_memory_mib"]:
+                metrics[f"profile_{name}_{key}"] = stats[key]
+        return metrics
+
+    def save(self, directory: Union[str, Path]) -> Path:
+        """
+        Write summary.json, a binary profile <phase>.prof readable by pstats and snakeviz,
+        and a text report <phase>.txt of the slowest functions of every phase
+        :param directory: location of the reports, created when missing
+        :return: location of the reports
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        utils.save_dict(self.summary(), Path(directory, "summary.json"))
+        for name, stats in self.phases.items():
+            stats["profile"].dump_stats(Path(directory, f"{name}.prof"))
+            report = io.StringIO()
+            pstats.Stats(stats["profile"], stream=report).sort_stats("cumulative").print_stats(
+                REPORT_LINES
+            )
+            Path(directory, f"{name}.txt").write_text(report.getvalue())
+        return directory
+
+    def log_to_mlflow(self) -> None:
+        """
+        Log the metrics and reports of the profile into the active MLflow run
+        :return:
+        """
+        if not self.enabled:
+            return
+        import mlflow
+
+        mlflow.log_metrics(self.metrics())
+        with tempfile.TemporaryDirectory() as dp:
+            mlflow.log_artifacts(self.save(dp), artifact_path="profile")
+        for name, stats in self.summary()["phases"].items():
+            logger.info(
+                f"{name}: {stats['wall_seconds']:.2f} s wall, {stats['cpu_seconds']:.2f} s CPU, "
+                f"{stats['peak_memory_mib']:.1f} MiB peak in {stats['calls']} calls"
+            )
+
+
+def is_active() -> bool:
+    """
+    Check whether a profiler is collecting phases
+    :return: True inside an enabled Profiler
+    """
+    return _active is not None
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Measure a phase with the active profiler, does nothing when profiling is disabled
+    :param name: name of the phase
+    :return:
+    """
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
@@ -1,34 +1,126 @@
 import json
 from argparse import Namespace
-from typing import Dict
+from typing import Dict, List, Sequence
 
 import mlflow
+import numpy as np
 import optuna
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble._forest import (
+    _generate_unsampled_indices,
+    _get_n_samples_bootstrap,
+)
 from sklearn.metrics import mean_squared_error
 
-from runsor import data, evaluate, utils
+from runsor import data, evaluate, profiling, utils
 
+# Number of trees added to the forest in every training step
+GROWTH_STEP = 100
 
-def train(df: pd.DataFrame, args: Namespace, trial: optuna.trial._trial.Trial = None) -> Dict:
+
+def growth_steps(n_estimators: int, step: int = GROWTH_STEP) -> List[int]:
+    """
+    Sizes of the forest after each training step
+    :param n_estimators: final number of trees
+    :param step: number of trees added in every step. Defaults on GROWTH_STEP
+    :return: list of increasing forest sizes ending with n_estimators
+    """
+    return list(range(step, n_estimators, step)) + [n_estimators]
+
+
+class RunningPredictions:
+    """
+    Per-sample sums of tree predictions, updated only with the trees added since the last update.
+    In out-of-bag mode every tree contributes only to the samples left out of its bootstrap.
+    """
+
+    def __init__(self, X: np.ndarray, oob: bool = False, max_samples: float = None):
+        # Trees split on float32 values, predicting on the same values gives identical results
+        self.X = np.ascontiguousarray(X, dtype=np.float32)
+        self.oob = oob
+        self.n_samples_bootstrap = _get_n_samples_bootstrap(len(self.X), max_samples)
+        self.sums = np.zeros(len(self.X))
+        self.counts = np.zeros(len(self.X), dtype=np.int64)
+        self.n_trees = 0
+
+    def update(self, trees: Sequence) -> None:
+        """
+        Add predictions of new trees
+        :param trees: fitted trees that were not added yet
+        """
+        for tree in trees:
+            if self.oob:
+                rows = _generate_unsampled_indices(
+                    tree.random_state, len(self.X), self.n_samples_bootstrap
+                )
+                self.sums[rows] += tree.predict(self.X[rows], check_input=False)
+                self.counts[rows] += 1
+            else:
+                self.sums += tree.predict(self.X, check_input=False)
+                self.counts += 1
+        self.n_trees += len(trees)
+
+    def loss(self, y: np.ndarray) -> float:
+        """
+        Mean squared error of the current ensemble
+        :param y: true values of the samples
+        :return: MSE over samples with at least one prediction
+        """
+        seen = self.counts > 0
+        return mean_squared_error(y[seen], self.sums[seen] / self.counts[seen])
+
+
+VALIDATION_MODES = ["holdout", "oob"]
+
+
+def check_validation(validation: str) -> None:
+    """
+    Check the validation mode is supported
+    :param validation: name of the validation mode
+    """
+    if validation not in VALIDATION_MODES:
+        raise ValueError(
+            f"Unknown validation mode: {validation}. Expected one of {VALIDATION_MODES}"
+        )
+
+
+def train(
+    df: pd.DataFrame,
+    args: Namespace,
+    trial: optuna.trial._trial.Trial = None,
+    engine: str = "columnar",
+    preprocessed: bool = False,
+    dataset: data.Dataset = None,
+    validation: str = "holdout",
+) -> Dict:
     """
     Train model on the data
     :param df: Pandas DataFrame with data for training
     :param args: arguments for the model
     :param trial: optimization trail. Defaults on None
+    :param engine: preprocess engine, "columnar" or "python". Defaults on "columnar"
+    :param preprocessed: whether df was already preprocessed. Defaults on False
+    :param dataset: data splits prepared with data.prepare_dataset, df is ignored when given.
+    Defaults on None
+    :param validation: "holdout" computes the validation loss on the validation set, "oob" on
+    the out-of-bag samples of the training set. Defaults on "holdout"
     :return: artifacts from the run
     """
+    check_validation(validation)
+
     # Setup
     utils.set_seeds()
 
-    # Preprocess
-    df = data.preprocess(df)
+    if dataset is None:
+        # Preprocess
+        if not preprocessed:
+            df = data.preprocess(df, engine=engine)
 
-    # Split data
-    X_train, X_val, X_test, y_train, y_val, y_test = data.get_data_splits(
-        df.drop("Calories", axis=1), y=df["Calories"], val_set=True
-    )
+        # Split data
+        with profiling.phase("split"):
+            dataset = data.prepare_dataset(df)
+    X_train, X_val, X_test, y_train, y_val, y_test = dataset[:6]
 
     # Model
     model = RandomForestRegressor(
@@ -38,39 +130,65 @@ def train(df: pd.DataFrame, args: Namespace, trial: optuna.trial._trial.Trial =
         min_samples_leaf=args.min_samples_leaf,
         max_features=args.max_features,
         bootstrap=True,
+        warm_start=True,
     )
 
-    # Training
-    for i in range(0, args.n_estimators + 1, 100):
-        # Train model on a training set
-        model.fit(X_train, y_train)
-        train_loss = mean_squared_error(y_train, model.predict(X_train))
-        val_loss = mean_squared_error(y_val, model.predict(X_val))
-
-        # Log
-        if not trial:
-            mlflow.log_metrics({"train_loss": train_loss, "val_loss": val_loss}, step=i)
-
-        if trial:
-            # Report the validation loss to Optuna
-            trial.report(val_loss, step=i)
-            # If the trial should be pruned, stop training the model
-            if trial.should_prune():
-                raise optuna.TrialPruned()
+    # Losses are kept up to date with predictions of the new trees only
+    train_predictions = RunningPredictions(X_train)
+    if validation == "oob":
+        val_predictions, y_eval = RunningPredictions(X_train, oob=True), y_train
+    else:
+        val_predictions, y_eval = RunningPredictions(X_val), y_val
+
+    with profiling.phase("fit"):
+        # Training, every step adds new trees to the already fitted ones
+        for i in growth_steps(args.n_estimators):
+            # Train model on a training set
+            model.set_params(n_estimators=i)
+            model.fit(X_train, y_train)
+            n_fitted = train_predictions.n_trees
+            new_trees = model.estimators_[n_fitted:]
+            train_predictions.update(new_trees)
+            val_predictions.update(new_trees)
+            train_loss = train_predictions.loss(y_train)
+            val_loss = val_predictions.loss(y_eval)
+
+            # Log
+            if not trial:
+                mlflow.log_metrics({"train_loss": train_loss, "val_loss": val_loss}, step=i)
+
+            if trial:
+                # Report the validation loss to Optuna
+                trial.report(val_loss, step=i)
+                # If the trial should be pruned, stop training the model
+                if trial.should_prune():
+                    raise optuna.TrialPruned()
+        model.set_params(warm_start=False)
 
     # Evaluation
-    y_pred = model.predict(X_test)
-    performance = evaluate.get_metrics(y_true=y_test, y_pred=y_pred)
+    with profiling.phase("evaluate"):
+        y_pred = model.predict(X_test)
+        performance = evaluate.get_metrics(y_true=y_test, y_pred=y_pred)
 
     return {"args": args, "model": model, "performance": performance}
 
 
-def objective(args: Namespace, df: pd.DataFrame, trial: optuna.trial._trial.Trial) -> float:
+def objective(
+    args: Namespace,
+    df: pd.DataFrame,
+    trial: optuna.trial._trial.Trial,
+    preprocessed: bool = False,
+    dataset: data.Dataset = None,
+    validation: str = "holdout",
+) -> float:
     """
     Objective function for optimization each trial
     :param args: arguments to use for training
     :param df: Pandas DataFrame with data for training
     :param trial: Optimization trial
+    :param preprocessed: whether df was already preprocessed. Defaults on False
+    :param dataset: data splits shared by all trials of a study. Defaults on None
+    :param validation: "holdout" or "oob" validation loss. Defaults on "holdout"
     :return:
     """
     # Parameters to be tuned
@@ -80,7 +198,14 @@ def objective(args: Namespace, df: pd.DataFrame, trial: optuna.trial._trial.Tria
     args.min_samples_leaf = trial.suggest_int("min_samples_leaf", 1, 10, step=1)
     args.max_features = trial.suggest_categorical("max_features", [1.0, "log2", "sqrt"])
 
-    artifacts = train(df=df, args=args, trial=trial)
+    artifacts = train(
+        df=df,
+        args=args,
+        trial=trial,
+        preprocessed=preprocessed,
+        dataset=dataset,
+        validation=validation,
+    )
 
     # Set additional attributes
     overall_performance = artifacts["performance"]
@@ -1,6 +1,10 @@
+import hashlib
 import json
 import random
-from typing import Dict
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
 
 import numpy as np
 
@@ -39,3 +43,111 @@ def set_seeds(seed: int = 42) -> None:
     # Set seeds
     np.random.seed(seed)
     random.seed(seed)
+
+
+def file_hash(filepath: str, block_size: int = 1 << 20) -> str:
+    """
+    Compute SHA-256 hash of a file content without loading the whole file
+    :param filepath: location of file
+    :param block_size: number of bytes read at once. Defaults to 1 MiB
+    :return: hexadecimal digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Bounded least recently used cache counting hits and misses, with optional expiry of items
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = None):
+        """
+        :param maxsize: maximal number of stored items
+        :param ttl: seconds after which a stored item expires, never when None. Defaults to None
+        """
+        if maxsize < 1:
+            raise ValueError(f"Invalid cache size: {maxsize}, expected a positive number")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"Invalid cache TTL: {ttl}, expected a positive number of seconds")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None, valid: Callable[[Any], bool] = None) -> Any:
+        """
+        Get an item and mark it as recently used
+        :param key: key of the item
+        :param default: value returned when the key is missing. Defaults to None
+        :param valid: function telling whether a stored item is still up to date, stale items
+        are removed and counted as misses like expired ones. Defaults to None
+        :return: stored item or default
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            value, expires = self._items[key]
+            expired = expires is not None and expires <= time.monotonic()
+            if expired or (valid is not None and not valid(value)):
+                del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store an item, evicting the least recently used one when the cache is full
+        :param key: key of the item
+        :param value: item to store
+        :return:
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Remove an item if it is stored
+        :param key: key of the item
+        :return:
+        """
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove all items and reset the counters
+        :return:
+        """
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def info(self) -> Dict:
+        """
+        Statistics of the cache
+        :return: dictionary with hits, misses, hit ratio, current and maximal size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+            "maxsize": self.maxsize,
+        }
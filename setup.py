@@ -8,7 +8,12 @@ with open(Path(BASE_DIR, "requirements.txt")) as file:
     required_packages = [ln.strip() for ln in file.readlines()]
 
 style_packages = ["black==23.3.0", "flake8==6.0.0", "isort==5.12.0"]
-test_packages = ["pytest==7.3.1", "pytest-cov==4.0.0", "great-expectations==0.16.13"]
+test_packages = [
+    "pytest==7.3.1",
+    "pytest-cov==4.0.0",
+    "great-expectations==0.16.13",
+    "httpx==0.24.1",
+]
 
 # Setup object describe how to set up package and it's dependencies
 setup(
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Dict
+
+import httpx
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from backend import api
+from backend.schemas import FEATURES
+from config import config
+from runsor import data
+from tests.benchmarks.generator import activity_log
+
+ROUTES = ["/predict", "/predict/async"]
+
+
+async def load(client: httpx.AsyncClient, route: str, payloads, concurrency: int) -> Dict:
+    """
+    Send all payloads to a route from a number of concurrent clients
+    :param client: HTTP client of the application
+    :param route: path of the prediction route
+    :param payloads: list of JSON bodies
+    :param concurrency: number of requests in flight
+    :return: dictionary with throughput and latency percentiles
+    """
+    latencies = []
+    pending = iter(payloads)
+
+    async def user():
+        for payload in pending:
+            start = time.perf_counter()
+            response = await client.post(route, json=payload)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return {
+        "route": route,
+        "concurrency": concurrency,
+        "requests_per_second": len(payloads) / seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+async def run(cli_args: argparse.Namespace) -> list:
+    """
+    Load every route at every concurrency level
+    :param cli_args: command line arguments
+    :return: list of results
+    """
+    df = data.preprocess(activity_log(cli_args.rows))
+    features = df.drop("Calories", axis=1)
+    api.artifacts = {
+        "model": RandomForestRegressor(
+            n_estimators=cli_args.n_estimators, max_depth=10, random_state=42
+        ).fit(features.values, df["Calories"])
+    }
+    runs = features.iloc[:, : len(FEATURES)].set_axis(FEATURES, axis=1)
+    payloads = [
+        {"runs": runs.sample(cli_args.runs_per_request, random_state=i).to_dict(orient="records")}
+        for i in range(cli_args.requests)
+    ]
+
+    # Lifespan events are not sent by the client, so the application is started by hand
+    config.MICRO_BATCHING = cli_args.batching
+    api.start_batcher()
+    api.start_executor()
+    results = []
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for concurrency in cli_args.concurrency:
+            for route in ROUTES:
+                result = await load(client, route, payloads, concurrency)
+                results.append(result)
+                print(
+                    f"{route:>15} concurrency {concurrency:>3} "
+                    f"{result['requests_per_second']:8.1f} req/s "
+                    f"p50 {result['p50_ms']:8.1f} ms p99 {result['p99_ms']:8.1f} ms",
+                    file=sys.stderr,
+                )
+    api.stop_batcher()
+    api.stop_executor()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the sync and async prediction routes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--runs-per-request", type=int, default=2)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--batching", action=argparse.BooleanOptionalAction, default=True)
+    cli_args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(cli_args)), indent=2))
@@ -0,0 +1,98 @@
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from runsor import inference
+
+# Executed in a fresh interpreter, so the memory of one format does not affect the other
+LOAD_SCRIPT = """
+import json, sys, time
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+from runsor import inference
+
+
+def memory():
+    status = dict(line.split(":", 1) for line in open("/proc/self/status"))
+    return {key: int(status[key].split()[0]) / 1024 for key in ["RssAnon", "RssFile"]}
+
+
+model_format, path = sys.argv[1:]
+before = memory()
+start = time.perf_counter()
+if model_format == "pickle":
+    model = joblib.load(path)
+else:
+    model = inference.FlatForest.load(path, mmap=model_format == "flat_mmap")
+load_seconds = time.perf_counter() - start
+model.predict(np.zeros((1, 7)))
+after = memory()
+print(json.dumps({
+    "load_seconds": load_seconds,
+    "private_mib": after["RssAnon"] - before["RssAnon"],
+    "shared_mib": after["RssFile"] - before["RssFile"],
+}))
+"""
+
+
+def measure_load(model_format: str, path: Path) -> dict:
+    """
+    Load a model in a new process and report its load time and memory
+    :param model_format: "pickle", "flat" or "flat_mmap"
+    :param path: location of the model file or forest directory
+    :return: dictionary with load time in seconds and private and shared memory in MiB
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", LOAD_SCRIPT, model_format, str(path)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare load time and RSS of model formats")
+    parser.add_argument("--n-estimators", type=int, nargs="+", default=[100, 300, 600])
+    parser.add_argument("--rows", type=int, default=20_000)
+    cli_args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(cli_args.rows, 7))
+    y = X @ rng.normal(size=7) + rng.normal(size=cli_args.rows)
+    results = []
+    for n_estimators in cli_args.n_estimators:
+        model = RandomForestRegressor(n_estimators=n_estimators, random_state=42).fit(X, y)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            joblib.dump(model, Path(tmpdir, "model.pkl"))
+            forest = inference.FlatForest.from_model(model)
+            forest.save(Path(tmpdir, "forest"))
+            forest.save(Path(tmpdir, "forest32"), float32=True)
+            paths = {
+                "pickle": Path(tmpdir, "model.pkl"),
+                "flat": Path(tmpdir, "forest"),
+                "flat_mmap": Path(tmpdir, "forest"),
+                "flat_mmap_float32": Path(tmpdir, "forest32"),
+            }
+            for name, path in paths.items():
+                model_format = "flat_mmap" if name.startswith("flat_mmap") else name
+                result = {"n_estimators": n_estimators, "format": name}
+                result.update(measure_load(model_format, path))
+                results.append(result)
+                print(
+                    f"{n_estimators:>5} trees {name:>18} {result['load_seconds']:8.4f} s "
+                    f"private {result['private_mib']:8.1f} MiB "
+                    f"shared {result['shared_mib']:8.1f} MiB",
+                    file=sys.stderr,
+                )
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,34 @@
+import argparse
+import json
+import time
+
+from runsor import data
+from tests.benchmarks.generator import activity_log
+
+
+def benchmark(rows: int, repeat: int = 3) -> dict:
+    """
+    Time both time_converter engines on the same data
+    :param rows: number of rows
+    :param repeat: number of repetitions, the best one is reported. Defaults to 3
+    :return: rows per second of each engine
+    """
+    df = activity_log(rows)[["Time"]]
+    results = {"rows": rows}
+    for engine in ["python", "columnar"]:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data.time_converter(df.copy(), "Time", engine=engine)
+            best = min(best, time.perf_counter() - start)
+        results[engine] = {"seconds": best, "rows_per_second": rows / best}
+    results["speedup"] = results["python"]["seconds"] / results["columnar"]["seconds"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of time_converter engines")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    cli_args = parser.parse_args()
+    print(json.dumps([benchmark(rows, cli_args.repeat) for rows in cli_args.rows], indent=2))
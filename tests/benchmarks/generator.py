@@ -0,0 +1,177 @@
+import argparse
+from pathlib import Path
+from typing import Iterator, Union
+
+import numpy as np
+import pandas as pd
+
+# Columns in the order of a Garmin Connect activity export
+COLUMNS = [
+    "Activity Type",
+    "Date",
+    "Title",
+    "Distance",
+    "Calories",
+    "Time",
+    "Avg HR",
+    "Max HR",
+    "Avg Run Cadence",
+    "Max Run Cadence",
+    "Avg Pace",
+    "Best Pace",
+    "Elev Gain",
+    "Elev Loss",
+    "Avg Stride Length",
+    "Best Lap Time",
+    "Number of Laps",
+]
+# Columns in which the watch can leave a "--" gap
+GAP_COLUMNS = ["Avg HR", "Max HR", "Avg Run Cadence", "Elev Gain", "Elev Loss"]
+
+
+def _clock(seconds: np.ndarray) -> pd.Series:
+    """
+    Format seconds as %H:%M:%S
+    :param seconds: NumPy array with whole seconds
+    :return: Pandas Series with formatted times
+    """
+    seconds = pd.Series(seconds)
+    return (
+        (seconds // 3600).astype(str)
+        + ":"
+        + (seconds // 60 % 60).map("{:02d}".format)
+        + ":"
+        + (seconds % 60).map("{:02d}".format)
+    )
+
+
+def _lap(seconds: np.ndarray, tenths: np.ndarray) -> pd.Series:
+    """
+    Format seconds as %M:%S.%f with a single fractional digit
+    :param seconds: NumPy array with whole seconds, below one hour
+    :param tenths: NumPy array with tenths of a second
+    :return: Pandas Series with formatted times
+    """
+    seconds = pd.Series(seconds)
+    return (
+        (seconds // 60 % 60).map("{:02d}".format)
+        + ":"
+        + (seconds % 60).map("{:02d}".format)
+        + "."
+        + pd.Series(tenths).astype(str)
+    )
+
+
+def _pace(seconds: np.ndarray) -> pd.Series:
+    """
+    Format seconds per mile as %M:%S
+    :param seconds: NumPy array with whole seconds
+    :return: Pandas Series with formatted paces
+    """
+    seconds = pd.Series(seconds)
+    return (seconds // 60).astype(str) + ":" + (seconds % 60).map("{:02d}".format)
+
+
+def _thousands(values: np.ndarray) -> pd.Series:
+    """
+    Format integers with comma thousands separators, like "1,234"
+    :param values: NumPy array with integers
+    :return: Pandas Series with formatted numbers
+    """
+    return pd.Series(values).map("{:,}".format)
+
+
+def activity_log(rows: int, seed: int = 42, gap_rate: float = 0.02) -> pd.DataFrame:
+    """
+    Create realistic running activities in the Garmin export format
+    :param rows: number of activities
+    :param seed: seed of the random generator. Defaults to 42
+    :param gap_rate: share of values replaced with "--". Defaults to 0.02
+    :return: Pandas DataFrame with raw activities
+    """
+    rng = np.random.default_rng(seed)
+    distance = np.round(rng.gamma(4.0, 1.5, rows) + 0.5, 2)
+    pace = rng.integers(390, 720, rows)  # seconds per mile
+    time = (distance * pace).astype(int)
+    avg_hr = rng.integers(115, 185, rows)
+    cadence = rng.integers(150, 190, rows)
+    elev_gain = (distance * rng.uniform(0, 150, rows)).astype(int)
+    calories = (distance * rng.normal(105, 10, rows) * avg_hr / 150).astype(int)
+    best_pace = pace - rng.integers(20, 120, rows)
+    short = time < 3600
+
+    df = pd.DataFrame(
+        {
+            "Activity Type": "Running",
+            "Date": pd.Timestamp("2015-01-01")
+            + pd.to_timedelta(np.sort(rng.integers(0, 10 * 365 * 24 * 60, rows)), unit="min"),
+            "Title": rng.choice(["Cherry Run", "Ocean Run", "Trail Run", "Track"], rows),
+            "Distance": distance,
+            "Calories": _thousands(calories),
+            # Short activities are exported as %M:%S.%f, the other ones as %H:%M:%S
+            "Time": np.where(
+                short & (rng.random(rows) < 0.5),
+                _lap(time % 3600, rng.integers(0, 10, rows)),
+                _clock(time),
+            ),
+            "Avg HR": avg_hr,
+            "Max HR": avg_hr + rng.integers(5, 25, rows),
+            "Avg Run Cadence": cadence,
+            "Max Run Cadence": cadence + rng.integers(5, 30, rows),
+            "Avg Pace": _pace(pace),
+            "Best Pace": _pace(best_pace),
+            "Elev Gain": _thousands(elev_gain),
+            "Elev Loss": _thousands((elev_gain * rng.uniform(0.8, 1.2, rows)).astype(int)),
+            "Avg Stride Length": np.round(rng.uniform(0.9, 1.5, rows), 2),
+            "Best Lap Time": _lap(rng.integers(60, 400, rows), rng.integers(0, 10, rows)),
+            "Number of Laps": np.maximum(distance.astype(int), 1),
+        },
+        columns=COLUMNS,
+    )
+    df["Date"] = df["Date"].dt.strftime("%m/%d/%y %H:%M")
+
+    # Activities recorded without a sensor
+    for col in GAP_COLUMNS:
+        df[col] = df[col].astype(object).where(rng.random(rows) >= gap_rate, "--")
+    return df
+
+
+def activity_log_chunks(
+    rows: int, chunk_size: int = 100_000, seed: int = 42
+) -> Iterator[pd.DataFrame]:
+    """
+    Create activities in chunks, so logs of any size fit in memory
+    :param rows: total number of activities
+    :param chunk_size: number of activities in a chunk. Defaults to 100 000
+    :param seed: seed of the first chunk, next chunks use the following seeds. Defaults to 42
+    :return: generator of Pandas DataFrames with raw activities
+    """
+    for i, start in enumerate(range(0, rows, chunk_size)):
+        yield activity_log(min(chunk_size, rows - start), seed=seed + i)
+
+
+def write_activity_log(
+    filepath: Union[str, Path], rows: int, chunk_size: int = 100_000, seed: int = 42
+) -> Path:
+    """
+    Stream a synthetic activity_log.csv to disk
+    :param filepath: location of the CSV file
+    :param rows: number of activities
+    :param chunk_size: number of activities written at once. Defaults to 100 000
+    :param seed: seed of the random generator. Defaults to 42
+    :return: location of the CSV file
+    """
+    filepath = Path(filepath)
+    for i, chunk in enumerate(activity_log_chunks(rows, chunk_size, seed)):
+        chunk.to_csv(filepath, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    return filepath
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic Garmin activity log")
+    parser.add_argument("filepath")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    cli_args = parser.parse_args()
+    write_activity_log(cli_args.filepath, cli_args.rows, cli_args.chunk_size, cli_args.seed)
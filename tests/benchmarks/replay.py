@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+from itertools import cycle, islice
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+from config import config
+
+
+def read_requests(filepath: Path) -> List[Dict]:
+    """
+    Read captured requests
+    :param filepath: location of the JSON lines file written by backend.capture
+    :return: list of dictionaries with the route and body of every request
+    """
+    with open(filepath) as file:
+        requests = [json.loads(line) for line in file if line.strip()]
+    if not requests:
+        raise ValueError(f"No requests captured in {filepath}")
+    return requests
+
+
+def free_port() -> int:
+    """Port the server can listen on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, timeout: float) -> subprocess.Popen:
+    """
+    Start the API with uvicorn and wait until it answers the health check
+    :param port: port to listen on
+    :param timeout: seconds to wait for the model to load
+    :return: server process
+    """
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "backend.api:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=config.BASE_DIR,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise TimeoutError(f"Server did not start within {timeout} s")
+
+
+async def send(client: httpx.AsyncClient, request: Dict, start: float, results: List) -> None:
+    """
+    Send a request and record its latency, measured from the time it was due
+    :param client: HTTP client of the server
+    :param request: captured route and body
+    :param start: time the request was due
+    :param results: list receiving (latency, ok) tuples
+    """
+    try:
+        response = await client.post(request["route"], json=request["body"])
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    results.append((time.perf_counter() - start, ok))
+
+
+async def closed_loop(client: httpx.AsyncClient, requests: List[Dict], concurrency: int) -> List:
+    """Keep a number of requests in flight, every user sends its next request on a response."""
+    results = []
+    pending = iter(requests)
+
+    async def user():
+        for request in pending:
+            await send(client, request, time.perf_counter(), results)
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return results
+
+
+async def open_loop(client: httpx.AsyncClient, requests: List[Dict], rate: float) -> List:
+    """Send requests at a fixed rate, whether or not the previous ones were answered."""
+    results = []
+    tasks = []
+    start = time.perf_counter()
+    for i, request in enumerate(requests):
+        due = start + i / rate
+        await asyncio.sleep(max(due - time.perf_counter(), 0))
+        tasks.append(asyncio.create_task(send(client, request, due, results)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+async def replay(url: str, requests: List[Dict], cli_args: argparse.Namespace) -> Dict:
+    """
+    Replay captured requests against a server
+    :param url: base URL of the server
+    :param requests: captured requests, in the order they are sent
+    :param cli_args: command line arguments
+    :return: dictionary with throughput and latency percentiles
+    """
+    limits = httpx.Limits(max_connections=cli_args.max_connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        if cli_args.rate:
+            results = await open_loop(client, requests, cli_args.rate)
+        else:
+            results = await closed_loop(client, requests, cli_args.concurrency)
+        seconds = time.perf_counter() - start
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    mode = f"rate {cli_args.rate}/s" if cli_args.rate else f"concurrency {cli_args.concurrency}"
+    return {
+        "mode": mode,
+        "requests": len(results),
+        "errors": sum(not ok for _, ok in results),
+        "seconds": seconds,
+        "requests_per_second": len(results) / seconds,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured prediction requests")
+    parser.add_argument("filepath", nargs="?", default=config.CAPTURE_FP, type=Path)
+    parser.add_argument("--url", help="server to load, a local one is started when not given")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, help="requests per second, instead of concurrency")
+    parser.add_argument("--requests", type=int, help="number of requests, the log is repeated")
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    cli_args = parser.parse_args()
+
+    requests = read_requests(cli_args.filepath)
+    requests = list(islice(cycle(requests), cli_args.requests or len(requests)))
+    server = None
+    url = cli_args.url
+    if url is None:
+        port = free_port()
+        server = start_server(port, cli_args.startup_timeout)
+        url = f"http://127.0.0.1:{port}"
+    try:
+        result = asyncio.run(replay(url, requests, cli_args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(
+        f"{result['mode']}: {result['requests']} requests, {result['errors']} errors, "
+        f"{result['requests_per_second']:.1f} req/s, p50 {result['p50_ms']:.1f} ms "
+        f"p95 {result['p95_ms']:.1f} ms p99 {result['p99_ms']:.1f} ms",
+        file=sys.stderr,
+    )
+    print(json.dumps(result, indent=2))
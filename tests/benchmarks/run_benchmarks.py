@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import mlflow
+import pandas as pd
+from starlette.requests import Request
+
+from backend import api
+from backend.schemas import RunningPack
+from runsor import data, predict, train
+from tests.benchmarks.generator import write_activity_log
+
+BENCHMARKS = ["preprocess", "time_converter", "get_data_splits", "train", "predict", "api_predict"]
+# Names of the API fields in the order of the model features
+API_FIELDS = ["distance", "time", "heart_rate", "run_cadence", "pace", "elev_gain", "elev_loss"]
+
+
+def measure(fn: Callable, setup: Callable = tuple, repeat: int = 3) -> float:
+    """
+    Best wall time of a function, setup is excluded from the timing
+    :param fn: function to time
+    :param setup: function returning a tuple of fresh arguments for every repetition
+    :param repeat: number of repetitions. Defaults to 3
+    :return: best time in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        fn_args = setup()
+        start = time.perf_counter()
+        fn(*fn_args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def api_request() -> Request:
+    """
+    Request object passed to the API handlers
+    :return: Starlette request for POST /predict
+    """
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "scheme": "http",
+        "server": ("localhost", 8000),
+        "path": "/predict",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+    }
+    return Request(scope)
+
+
+def api_predict(payload: Dict) -> Dict:
+    """
+    Validate a payload and run the /predict handler, like FastAPI does for a request
+    :param payload: JSON body of the request
+    :return: response of the handler
+    """
+    run_pack = RunningPack.parse_obj(payload)
+    return api.predictValue(api_request(), run_pack)
+
+
+def benchmark_size(rows: int, benchmarks: List[str], cli_args: Namespace) -> List[Dict]:
+    """
+    Run the selected benchmarks on a synthetic activity log of a given size
+    :param rows: number of activities in the log
+    :param benchmarks: names of benchmarks to run
+    :param cli_args: command line arguments
+    :return: list of results
+    """
+    results = []
+
+    def record(name: str, seconds: float, n: int = rows) -> None:
+        results.append(
+            {"benchmark": name, "rows": n, "seconds": seconds, "rows_per_second": n / seconds}
+        )
+        print(f"{name:>20} {n:>9} rows {seconds:10.4f} s", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raw = pd.read_csv(write_activity_log(Path(tmpdir, "activity_log.csv"), rows))
+    df = data.preprocess(raw.copy())
+    if "preprocess" in benchmarks:
+        for engine in cli_args.engines:
+            seconds = measure(
+                lambda d: data.preprocess(d, engine=engine), lambda: (raw.copy(),), cli_args.repeat
+            )
+            record(f"preprocess[{engine}]", seconds)
+    if "time_converter" in benchmarks:
+        for engine in cli_args.engines:
+            seconds = measure(
+                lambda d: data.time_converter(d, "Time", engine=engine),
+                lambda: (raw[["Time"]].copy(),),
+                cli_args.repeat,
+            )
+            record(f"time_converter[{engine}]", seconds)
+    if "get_data_splits" in benchmarks:
+        X, y = df.drop("Calories", axis=1), df["Calories"]
+        seconds = measure(lambda: data.get_data_splits(X, y, val_set=True), repeat=cli_args.repeat)
+        record("get_data_splits", seconds)
+
+    # Model used by the prediction benchmarks
+    args = Namespace(
+        n_estimators=cli_args.n_estimators,
+        max_depth=cli_args.max_depth,
+        min_samples_split=2,
+        min_samples_leaf=1,
+        max_features=1.0,
+    )
+    if {"train", "predict", "api_predict"} & set(benchmarks):
+        dataset = data.prepare_dataset(df)
+        with mlflow.start_run(run_name=f"train_{rows}"):
+            start = time.perf_counter()
+            artifacts = train.train(df=None, args=args, dataset=dataset)
+        if "train" in benchmarks:
+            record("train", time.perf_counter() - start, len(dataset.X_train))
+    if "predict" in benchmarks:
+        features = df.drop("Calories", axis=1)
+        for engine in predict.PREDICTION_ENGINES:
+            seconds = measure(
+                lambda: predict.predict(features, artifacts, engine=engine), repeat=cli_args.repeat
+            )
+            record(f"predict[{engine}]", seconds)
+    if "api_predict" in benchmarks:
+        api.artifacts = artifacts
+        runs = df.drop("Calories", axis=1).iloc[: cli_args.api_rows]
+        runs.columns = API_FIELDS
+        payload = {"runs": runs.to_dict(orient="records")}
+        seconds = measure(lambda: api_predict(payload), repeat=cli_args.repeat)
+        record("api_predict", seconds, len(runs))
+    return results
+
+
+def metadata() -> Dict:
+    """
+    Describe the code and machine the benchmarks ran on
+    :return: dictionary with metadata
+    """
+    commit = subprocess.run(
+        ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=False
+    ).stdout.strip()
+    return {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the data, training and prediction code")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--engines", nargs="+", default=["columnar"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=10)
+    parser.add_argument("--api-rows", type=int, default=10_000)
+    parser.add_argument("--output", help="JSON file for the results, printed when not given")
+    cli_args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tracking_dir:
+        # Benchmark runs are not logged into the model registry
+        mlflow.set_tracking_uri(Path(tracking_dir).as_uri())
+        mlflow.set_experiment("benchmarks")
+        results = []
+        for rows in cli_args.rows:
+            results += benchmark_size(rows, cli_args.benchmarks, cli_args)
+
+    report = {"meta": metadata(), "args": vars(cli_args), "results": results}
+    if cli_args.output:
+        with open(cli_args.output, "w") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+    else:
+        print(json.dumps(report, indent=2))
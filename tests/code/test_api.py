@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.ensemble import RandomForestRegressor
+
+from backend import api
+from backend.schemas import RunningPack
+from config import config
+from runsor import predict
+
+runs = RunningPack.Config.schema_extra["example"]["runs"]
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    rng = np.random.default_rng(42)
+    X = rng.uniform(0, 5000, size=(200, 7))
+    model = RandomForestRegressor(n_estimators=5, random_state=42).fit(X, X[:, 0])
+    monkeypatch.setattr(api, "artifacts", {"model": model}, raising=False)
+    monkeypatch.setattr(config, "BULK_CHUNK_SIZE", 3)
+    # Lifespan events are not sent without a context manager, so artifacts are not loaded
+    api.start_executor()
+    yield TestClient(api.app)
+    api.stop_executor()
+
+
+def test_predict_async(client):
+    response = client.post("/predict/async", json={"runs": runs})
+    assert response.status_code == 200
+    expected = client.post("/predict", json={"runs": runs}).json()["data"]
+    assert response.json()["data"] == expected
+
+
+def test_capture(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "REQUEST_CAPTURE", True)
+    monkeypatch.setattr(config, "CAPTURE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(config, "CAPTURE_FP", tmp_path / "requests.jsonl")
+    api.start_capture()
+    try:
+        client.post("/predict", json={"runs": runs})
+        client.post("/predict/async", json={"runs": runs})
+    finally:
+        api.stop_capture()
+    lines = [json.loads(line) for line in config.CAPTURE_FP.read_text().splitlines()]
+    assert [line["route"] for line in lines] == ["/predict", "/predict/async"]
+    assert lines[0]["body"] == {"runs": runs}
+
+
+def test_swap_artifacts(client, monkeypatch):
+    monkeypatch.setattr(config, "MICRO_BATCHING", True)
+    monkeypatch.setattr(config, "RELOAD_GRACE_PERIOD", 0.0)
+    old = api.artifacts
+    new = {**old, "run_id": "new"}
+    api.swap_artifacts(new)
+    try:
+        response = client.post("/predict", json={"runs": runs})
+        assert response.json()["data"]["run_id"] == "new"
+        assert api.batcher is not None
+    finally:
+        api.swap_artifacts(old)
+        api.batcher.stop()
+        api.batcher = None
+
+
+def test_predict_bulk(client):
+    lines = [json.dumps(runs[i % 2]) for i in range(7)]
+    lines.insert(4, json.dumps({"distance": "far"}))
+    predict.PREDICTION_CACHE.clear()
+    response = client.post("/predict/bulk", content="\n".join(lines) + "\n")
+    assert response.status_code == 200
+    # Bulk predictions do not evict the cached single runs
+    assert len(predict.PREDICTION_CACHE) == 0
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    errors = [record for record in records if "error" in record]
+    predictions = [record for record in records if "error" not in record]
+    assert len(errors) == 1 and errors[0]["line"] == 5
+    # Same predictions as the regular route, in the order of the runs
+    expected = client.post("/predict", json={"runs": runs}).json()["data"]["predictions"]
+    assert predictions == [expected[i % 2] for i in range(7)]
+
+
+def test_metrics(client):
+    client.post("/predict", json={"runs": runs})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for stage in ["parse_validate", "to_array", "model_predict", "format_predictions"]:
+        assert f'runsor_stage_latency_seconds_count{{stage="{stage}"}}' in response.text
+    assert 'runsor_requests_total{method="POST",route="/predict",status="200"}' in response.text
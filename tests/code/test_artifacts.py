@@ -0,0 +1,102 @@
+import io
+import json
+import subprocess
+import sys
+import tarfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from backend.schemas import COLUMNS as FEATURES
+from config import config
+from runsor import artifacts
+
+
+@pytest.fixture()
+def bundle_fp(trained, tmp_path):
+    return artifacts.save_bundle(Path(tmp_path, "bundle.tar"), trained, "run", FEATURES)
+
+
+def test_bundle(trained, bundle_fp):
+    manifest = artifacts.read_manifest(bundle_fp)
+    assert manifest["run_id"] == "run"
+    assert manifest["features"] == FEATURES
+    assert set(manifest["sha256"]) == set(artifacts.BUNDLE_FILES)
+
+    loaded = artifacts.load_bundle(bundle_fp)
+    assert loaded["args"] == trained["args"]
+    assert loaded["performance"] == trained["performance"]
+    X = np.random.default_rng(0).uniform(0, 3000, size=(10, 7))
+    assert np.array_equal(loaded["model"].predict(X), trained["model"].predict(X))
+
+
+def test_bundle_checksum(bundle_fp, tmp_path):
+    # Rebuild the bundle with a performance.json not matching the manifest
+    tampered_fp = Path(tmp_path, "tampered.tar")
+    with tarfile.open(bundle_fp) as source, tarfile.open(tampered_fp, "w") as target:
+        for member in source.getmembers():
+            content = source.extractfile(member).read()
+            if member.name == "performance.json":
+                content = json.dumps({"RMSE": 0.0}).encode()
+                member.size = len(content)
+            target.addfile(member, fileobj=io.BytesIO(content))
+    with pytest.raises(ValueError):
+        artifacts.load_bundle(tampered_fp)
+    assert artifacts.load_bundle(tampered_fp, verify=False)["performance"] == {"RMSE": 0.0}
+
+
+def test_bundle_features(bundle_fp, tmp_path, monkeypatch):
+    assert artifacts.load_bundle(bundle_fp, features=FEATURES)["features"] == FEATURES
+    with pytest.raises(ValueError, match="features"):
+        artifacts.load_bundle(bundle_fp, features=FEATURES[::-1])
+    # A bundle not matching the served features is never served
+    monkeypatch.setattr(config, "SERVING_BUNDLE", Path(tmp_path, "serving", "bundle.tar"))
+    artifacts.promote_bundle(bundle_fp)
+    with pytest.raises(ValueError):
+        artifacts.load_serving_artifacts("run", features=FEATURES[:-1])
+
+
+def test_load_bundle_without_mlflow(bundle_fp):
+    code = (
+        "import sys; from runsor import artifacts; "
+        f"artifacts.load_bundle({str(bundle_fp)!r}); print('mlflow' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=config.BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.split()[-1] == "False"
+
+
+def test_load_serving_artifacts(bundle_fp, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SERVING_BUNDLE", Path(tmp_path, "serving", "bundle.tar"))
+    monkeypatch.setattr(config, "MODEL_REGISTRY", Path(tmp_path, "model"))
+    monkeypatch.setattr(artifacts, "load_artifacts", lambda run_id: {"run_id": run_id})
+    # Neither bundled nor registered
+    with pytest.raises(FileNotFoundError, match="bundle-run"):
+        artifacts.load_serving_artifacts("run")
+    for run_id in ["run", "other"]:
+        Path(config.MODEL_REGISTRY, "0", run_id).mkdir(parents=True)
+    # Runs missing from the bundle come from the model registry
+    assert artifacts.load_serving_artifacts("run") == {"run_id": "run"}
+    artifacts.promote_bundle(bundle_fp)
+    assert "model" in artifacts.load_serving_artifacts("run")
+    assert artifacts.load_serving_artifacts("other") == {"run_id": "other"}
+
+
+def test_artifacts_dir(tmp_path, monkeypatch):
+    from mlflow.tracking import MlflowClient
+
+    registry = Path(tmp_path, "model")
+    monkeypatch.setattr(config, "MODEL_REGISTRY", registry)
+    monkeypatch.setattr(config, "TRACKING_URI", registry.as_uri())
+    # The run is found in the registry of the config, not the one MLflow would default to
+    monkeypatch.delenv("MLFLOW_TRACKING_URI")
+    client = MlflowClient(tracking_uri=config.TRACKING_URI)
+    run = client.create_run(client.create_experiment("experiment"))
+    artifacts_dir = artifacts._artifacts_dir(run.info.run_id)
+    assert artifacts_dir == Path(registry, run.info.experiment_id, run.info.run_id, "artifacts")
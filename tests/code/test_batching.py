@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from backend.batching import MicroBatcher, _Request
+
+
+@pytest.fixture()
+def calls():
+    return []
+
+
+@pytest.fixture()
+def batcher(calls):
+    def predict_fn(X):
+        calls.append(len(X))
+        return X.sum(axis=1)
+
+    batcher = MicroBatcher(predict_fn, max_batch=8, max_wait=0.05).start()
+    yield batcher
+    batcher.stop()
+
+
+def test_micro_batcher(batcher, calls):
+    requests = [np.full((i % 3 + 1, 2), i, dtype=float) for i in range(12)]
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        results = list(executor.map(batcher.predict, requests))
+    # Every caller gets its own predictions
+    for X, result in zip(requests, results):
+        assert np.array_equal(result, X.sum(axis=1))
+    # Requests were coalesced into fewer model calls
+    assert len(calls) < len(requests)
+    metrics = batcher.metrics()
+    assert metrics["requests"] == len(requests)
+    assert metrics["rows"] == sum(calls) == sum(len(X) for X in requests)
+    assert metrics["batches"] == len(calls)
+    assert sum(metrics["batch_rows_histogram"].values()) == len(calls)
+
+
+def test_micro_batcher_error():
+    def predict_fn(X):
+        raise ValueError("Invalid input")
+
+    batcher = MicroBatcher(predict_fn).start()
+    with pytest.raises(ValueError):
+        batcher.predict(np.zeros((1, 2)))
+    batcher.stop()
+
+
+def test_micro_batcher_not_started():
+    with pytest.raises(RuntimeError):
+        MicroBatcher(lambda X: X).submit(np.zeros((1, 2)))
+
+
+def test_micro_batcher_stopped(batcher):
+    # Request queued behind the stop sentinel, as if submitted while stopping
+    batcher._queue.put(None)
+    future = Future()
+    batcher._queue.put(_Request(np.zeros((1, 2)), future, 0.0))
+    batcher.stop()
+    with pytest.raises(RuntimeError):
+        future.result(timeout=1)
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.zeros((1, 2)))
+
+
+def test_micro_batcher_timeout():
+    release = threading.Event()
+
+    def predict_fn(X):
+        release.wait()
+        return X.sum(axis=1)
+
+    batcher = MicroBatcher(predict_fn, timeout=0.05).start()
+    with pytest.raises(TimeoutError):
+        batcher.predict(np.zeros((1, 2)))
+    release.set()
+    batcher.stop()
@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from backend.capture import RequestCapture
+
+
+def read_lines(filepath):
+    return [json.loads(line) for line in Path(filepath).read_text().splitlines()]
+
+
+def test_capture(tmp_path):
+    filepath = Path(tmp_path, "requests.jsonl")
+    capture = RequestCapture(filepath, sample_rate=1.0).start()
+    for i in range(5):
+        assert capture.capture("/predict", {"runs": [{"distance": i}]})
+    capture.stop()
+    lines = read_lines(filepath)
+    assert [line["body"]["runs"][0]["distance"] for line in lines] == list(range(5))
+    assert {line["route"] for line in lines} == {"/predict"}
+    assert capture.metrics() == {"sampled": 5, "written": 5, "dropped": 0}
+
+    # Captures are appended to the file
+    capture.start()
+    capture.capture("/predict/async", {"runs": []})
+    capture.stop()
+    assert len(read_lines(filepath)) == 6
+
+
+def test_capture_sampling(tmp_path):
+    capture = RequestCapture(Path(tmp_path, "requests.jsonl"), sample_rate=0.0).start()
+    assert not capture.capture("/predict", {"runs": []})
+    capture.stop()
+    assert capture.metrics()["sampled"] == 0
+    # Nothing is captured before the writer starts
+    assert not RequestCapture(Path(tmp_path, "other.jsonl"), 1.0).capture("/predict", {})
+    with pytest.raises(ValueError):
+        RequestCapture(Path(tmp_path, "requests.jsonl"), sample_rate=2.0)
+
+
+def test_capture_limits(tmp_path):
+    filepath = Path(tmp_path, "requests.jsonl")
+    capture = RequestCapture(filepath, sample_rate=1.0, max_bytes=1)
+    capture.start()
+    for _ in range(3):
+        capture.capture("/predict", {"runs": []})
+    # Payloads that cannot be serialized are dropped without stopping the writer
+    capture.capture("/predict", {"runs": object()})
+    capture.stop()
+    assert len(read_lines(filepath)) == 1
+    assert capture.metrics()["dropped"] == 3
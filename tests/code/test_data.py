@@ -2,7 +2,8 @@ import numpy as np
 import pandas as pd
 import pytest
 
-from runsor import data
+import frontend.data
+from runsor import data, profiling
 
 
 @pytest.fixture(scope="module")
@@ -97,3 +98,202 @@ def test_get_data_splits(df):
     assert len(X_test) == len(X_test)
     assert len(X_train) / float(len(df)) == pytest.approx(0.8)
     assert len(X_test) / float(len(df)) == pytest.approx(0.2)
+
+
+@pytest.fixture(scope="module")
+def raw_df():
+    rng = np.random.default_rng(42)
+    n = 500
+    elev_gain = rng.integers(0, 2500, n)
+    minutes, seconds = rng.integers(5, 12, n), rng.integers(0, 60, n)
+    df = pd.DataFrame(
+        {
+            "Activity Type": ["Running"] * n,
+            "Date": ["7/15/20 9:41"] * n,
+            "Title": ["Cherry Run"] * n,
+            "Distance": np.round(rng.uniform(1, 30, n), 2),
+            "Calories": [f"{c:,}" for c in rng.integers(50, 3000, n)],
+            "Time": [
+                f"{m:02d}:{s:02d}.{s % 10}" if i % 3 == 0 else f"{m // 6}:{m:02d}:{s:02d}"
+                for i, (m, s) in enumerate(zip(minutes, seconds))
+            ],
+            "Avg HR": [str(h) if h % 17 else "--" for h in rng.integers(110, 190, n)],
+            "Max HR": rng.integers(150, 200, n),
+            "Avg Run Cadence": rng.integers(150, 190, n),
+            "Max Run Cadence": rng.integers(170, 210, n),
+            "Avg Pace": [f"{m}:{s:02d}" for m, s in zip(minutes, seconds)],
+            "Best Pace": ["6:20"] * n,
+            "Elev Gain": [f"{e:,}" for e in elev_gain],
+            "Elev Loss": [f"{e:,}.0" for e in elev_gain],
+            "Avg Stride Length": np.round(rng.uniform(0.9, 1.5, n), 2),
+            "Best Lap Time": ["00:02.3"] * n,
+            "Number of Laps": rng.integers(1, 30, n),
+        }
+    )
+    return df
+
+
+@pytest.mark.parametrize("mile_units", [True, False])
+@pytest.mark.parametrize("drop_col", [True, False])
+def test_preprocess_engines_equivalent(raw_df, mile_units, drop_col):
+    expected = data.preprocess(raw_df.copy(), mile_units, drop_col, engine="python")
+    result = data.preprocess(raw_df.copy(), mile_units, drop_col, engine="columnar")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_preprocess_frame(raw_df):
+    expected = data.preprocess(raw_df.copy())
+    pd.testing.assert_frame_equal(data.preprocess_frame(raw_df.copy()), expected)
+
+
+def test_to_int_column():
+    values = pd.Series(["1,234", "12", "5,000,000.5", 7, "0.0"], index=[3, 1, 4, 1, 5])
+    expected = [int(float(str(x).replace(",", ""))) for x in values]
+    result = data._to_int_column(values)
+    assert result.tolist() == expected
+    assert result.index.equals(values.index)
+
+
+def test_pace_to_seconds():
+    # Paces of an hour or more are outside %M:%S but still converted
+    pace = pd.Series(["5:26", "08:03", "75:10"])
+    assert data._pace_to_seconds(pace).tolist() == [326, 483, 4510]
+    with pytest.raises(ValueError):
+        data._pace_to_seconds(pd.Series(["5:26", "--"]))
+
+
+def test_preprocess_unknown_engine(df):
+    with pytest.raises(ValueError):
+        data.preprocess(df, engine="spark")
+
+
+@pytest.mark.parametrize(
+    "kind, values, seconds",
+    [
+        ("time", ["0:43:55", "00:02.3", "03:32.7", "1:02:03"], [2635, 2, 212, 3723]),
+        ("clock", ["00:15:26", "1:00:00"], [926, 3600]),
+        ("pace", ["05:26", "7:02"], [326, 422]),
+    ],
+)
+def test_parse_durations(kind, values, seconds):
+    durations, invalid = data.parse_durations(pd.Series(values), kind=kind)
+    assert durations.tolist() == seconds
+    assert invalid.empty
+
+
+def test_frontend_conversions():
+    assert frontend.data.time_conversion("00:15:26") == 926
+    assert frontend.data.pace_conversion("05:26") == 326
+    paces = frontend.data.pace_conversion(pd.Series(["05:26", "7:02"]))
+    assert paces.tolist() == [326, 422]
+    # Invalid values are reported by index
+    with pytest.raises(ValueError, match=r"\[1, 2\]"):
+        frontend.data.time_conversion(pd.Series(["00:15:26", "15:26", "--"]))
+    with pytest.raises(ValueError):
+        frontend.data.pace_conversion("5:26:00")
+
+
+def test_parse_durations_invalid_rows():
+    values = pd.Series(["0:43:55", "--", "0:61:00", None, "05:26"], index=[10, 11, 12, 13, 14])
+    durations, invalid = data.parse_durations(values, kind="time")
+    assert invalid.tolist() == [11, 12, 13, 14]
+    assert durations[10] == 2635
+    assert durations[invalid].isna().all()
+
+
+def test_time_converter_engines_equivalent(raw_df):
+    expected = data.time_converter(raw_df.copy(), "Time", engine="python")
+    result = data.time_converter(raw_df.copy(), "Time", engine="columnar")
+    pd.testing.assert_series_equal(result["Time"], expected["Time"])
+
+
+def test_time_converter_reports_invalid_rows(df):
+    invalid_df = pd.DataFrame({"Time": ["0:43:55", "43 min", "0:40:29"]})
+    with pytest.raises(ValueError, match=r"\[1\]"):
+        data.time_converter(invalid_df, "Time")
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 37, 1000])
+def test_load_preprocessed_chunks(raw_df, tmp_path, chunk_size):
+    filepath = tmp_path / "activity_log.csv"
+    raw_df.to_csv(filepath, index=False)
+    expected = data.preprocess(pd.read_csv(filepath))
+    result = data.load_preprocessed(filepath, chunk_size=chunk_size, use_cache=False)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_preprocess_chunks(raw_df, tmp_path):
+    filepath = tmp_path / "activity_log.csv"
+    raw_df.to_csv(filepath, index=False)
+    chunks = list(data.preprocess_chunks(filepath, chunk_size=100, drop_col=False))
+    assert len(chunks) == 5
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all("Title" in chunk.columns for chunk in chunks)
+
+
+def test_load_preprocessed_cache(raw_df, tmp_path, monkeypatch):
+    monkeypatch.setattr(data.config, "PREPROCESSED_STORE", tmp_path)
+    filepath = tmp_path / "activity_log.csv"
+    raw_df.to_csv(filepath, index=False)
+
+    # First load stores the dataset, second one reads it back
+    expected = data.load_preprocessed(filepath)
+    cache_fp = data.cached_dataset(filepath)
+    assert cache_fp.exists()
+    pd.testing.assert_frame_equal(data.load_preprocessed(filepath), expected)
+
+    # Parameters are part of the key
+    data.load_preprocessed(filepath, drop_col=False)
+    assert len(list(tmp_path.glob("*.parquet"))) == 2
+
+    # New file content makes the old entry stale
+    raw_df.iloc[:100].to_csv(filepath, index=False)
+    assert len(data.load_preprocessed(filepath)) < len(expected)
+    assert not cache_fp.exists()
+    assert len(list(tmp_path.glob("*.parquet"))) == 2
+
+
+def test_prepare_dataset(raw_df):
+    df = data.preprocess(raw_df.copy())
+    dataset = data.prepare_dataset(df)
+    assert dataset.features == df.drop("Calories", axis=1).columns.tolist()
+    assert len(dataset.X_train) + len(dataset.X_val) + len(dataset.X_test) == len(df)
+    for array in dataset[:6]:
+        assert array.flags.c_contiguous
+        assert not array.flags.writeable
+    # Split is stable between calls
+    assert np.array_equal(data.prepare_dataset(df).y_test, dataset.y_test)
+
+
+def test_compact_dtypes(raw_df):
+    df = data.preprocess(raw_df.copy())
+    compact = data.compact_dtypes(df)
+    assert compact["Avg HR"].dtype == np.int16
+    assert compact["Distance"].dtype == np.float32
+    assert data.memory_footprint(compact) < data.memory_footprint(df)
+    assert np.array_equal(compact["Calories"].values, df["Calories"].values)
+
+
+def test_log_memory_footprint(raw_df, monkeypatch):
+    measured = []
+    monkeypatch.setattr(data, "memory_footprint", lambda obj, deep: measured.append(deep) or 0)
+    data.log_memory_footprint("raw data", raw_df)
+    # Strings are measured only when profiling or debugging
+    with profiling.Profiler():
+        data.log_memory_footprint("raw data", raw_df)
+    assert measured == [False, True]
+
+
+def test_compact_dtypes_overflow(raw_df):
+    df = data.preprocess(raw_df.copy())
+    df.loc[0, "Avg HR"] = 40000
+    with pytest.raises(ValueError, match="Avg HR"):
+        data.compact_dtypes(df)
+
+
+def test_prepare_dataset_float32(raw_df):
+    df = data.compact_dtypes(data.preprocess(raw_df.copy()))
+    dataset = data.prepare_dataset(df, float32=True)
+    assert dataset.X_train.dtype == np.float32
+    assert dataset.y_train.dtype == np.float64
+    assert np.array_equal(dataset.X_test, data.prepare_dataset(df).X_test.astype(np.float32))
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from runsor import inference
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(400, 7)) * 100
+    y = X @ rng.normal(size=7) + rng.normal(size=400)
+    return X, y
+
+
+@pytest.mark.parametrize("max_depth", [None, 3])
+def test_flat_forest(data, max_depth):
+    X, y = data
+    model = RandomForestRegressor(n_estimators=20, max_depth=max_depth, random_state=42)
+    model.fit(X, y)
+    forest = inference.FlatForest.from_model(model)
+    X_new = np.random.default_rng(0).normal(size=(100, 7)) * 100
+    # Bit for bit equal, also when rows are split into batches
+    assert np.array_equal(forest.predict(X_new), model.predict(X_new))
+    assert np.array_equal(forest.predict(X_new, batch_size=7), model.predict(X_new))
+    assert np.array_equal(forest.predict(X[:1]), model.predict(X[:1]))
+
+
+def test_flat_forest_invalid_input(data):
+    X, y = data
+    model = RandomForestRegressor(n_estimators=2, random_state=42).fit(X, y)
+    with pytest.raises(ValueError):
+        inference.FlatForest.from_model(RandomForestRegressor())
+    with pytest.raises(ValueError):
+        inference.FlatForest.from_model(model).predict(X[:, :3])
+
+
+def test_compile_forest(data):
+    X, y = data
+    model = RandomForestRegressor(n_estimators=2, random_state=42).fit(X, y)
+    assert inference.compile_forest(model) is inference.compile_forest(model)
+
+
+def test_save_load_forest(data, tmp_path):
+    X, y = data
+    model = RandomForestRegressor(n_estimators=10, random_state=42).fit(X, y)
+    forest = inference.FlatForest.from_model(model)
+    forest.save(Path(tmp_path, "forest"))
+    loaded = inference.FlatForest.load(Path(tmp_path, "forest"))
+    assert isinstance(loaded.threshold, np.memmap)
+    assert np.array_equal(loaded.predict(X), model.predict(X))
+
+
+def test_save_load_forest_float32(data, tmp_path):
+    X, _ = data
+    # Integer targets in pure leaves are exact in float32, so only the splits could differ
+    y = np.round(X[:, 0] + X[:, 1])
+    model = RandomForestRegressor(n_estimators=10, random_state=42).fit(X, y)
+    forest = inference.FlatForest.from_model(model)
+    forest.save(Path(tmp_path, "forest32"), float32=True)
+    loaded = inference.FlatForest.load(Path(tmp_path, "forest32"), mmap=False)
+    assert loaded.value.dtype == loaded.threshold.dtype == np.float32
+
+    # Rows with a feature on, just below and just above every split threshold
+    split = forest.left != np.arange(len(forest.left))
+    features, thresholds = forest.feature[split], forest.threshold[split]
+    assert np.any(thresholds.astype(np.float32) > thresholds)
+    values = np.float32(thresholds)
+    edges = [values, np.nextafter(values, np.float32(-np.inf)), np.nextafter(values, np.inf)]
+    X_edges = np.repeat(X[:1], 3 * len(values), axis=0)
+    X_edges[np.arange(len(X_edges)), np.tile(features, 3)] = np.concatenate(edges)
+    assert np.array_equal(loaded.predict(X_edges), model.predict(X_edges))
+    assert np.array_equal(loaded.predict(X), model.predict(X))
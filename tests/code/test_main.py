@@ -1,22 +1,40 @@
+import os
+import shutil
 from pathlib import Path
 
+import joblib
 import mlflow.client
+import numpy as np
+import optuna
 import pandas as pd
 import pytest
 from typer.testing import CliRunner
 
 from config import config
-from runsor import main
+from runsor import data, inference, main, predict, utils
+from runsor.artifacts import load_bundle
 from runsor.main import app
+from tests.benchmarks.generator import activity_log
 
 runner = CliRunner()
-args_fp = Path(config.BASE_DIR, "tests", "code", "test_args.json")
 
 
-def delete_experiment(experiment_name):
-    client = mlflow.tracking.MlflowClient()
-    experiment = client.get_experiment_by_name(experiment_name)
-    client.delete_experiment(experiment.experiment_id)
+@pytest.fixture()
+def args_fp(tmp_path, monkeypatch):
+    """Arguments file and stores of a training run, kept out of the repository."""
+    monkeypatch.setattr(config, "MODEL_REGISTRY", Path(tmp_path, "model"))
+    monkeypatch.setattr(config, "PREPROCESSED_STORE", Path(tmp_path, "preprocessed"))
+    monkeypatch.setattr(config, "OPTUNA_STORE", Path(tmp_path, "optuna"))
+    monkeypatch.setattr(config, "SERVING_STORE", Path(tmp_path, "serving"))
+    monkeypatch.setattr(config, "SERVING_BUNDLE", Path(tmp_path, "serving", "bundle.tar"))
+    for directory in [config.MODEL_REGISTRY, config.PREPROCESSED_STORE, config.OPTUNA_STORE]:
+        directory.mkdir()
+    # Read by MLflow on every call, also by the optimization workers
+    monkeypatch.setattr(config, "TRACKING_URI", Path(tmp_path, "model").as_uri())
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", config.TRACKING_URI)
+    filepath = Path(tmp_path, "args.json")
+    shutil.copy(Path(config.BASE_DIR, "tests", "code", "test_args.json"), filepath)
+    return filepath
 
 
 @pytest.fixture(scope="module")
@@ -41,7 +59,7 @@ def test_el_data():
 
 
 @pytest.mark.training
-def test_train_model():
+def test_train_model(args_fp):
     experiment_name = "test_experiment"
     run_name = "test_run"
     result = runner.invoke(
@@ -55,12 +73,34 @@ def test_train_model():
         ],
     )
     assert result.exit_code == 0
-    # Delete experiment after running test
-    delete_experiment(experiment_name)
+    # Every run carries a serving bundle
+    run = mlflow.search_runs(experiment_names=[experiment_name], output_format="list")[0]
+    artifacts = mlflow.MlflowClient().list_artifacts(run.info.run_id)
+    assert "bundle.tar" in [artifact.path for artifact in artifacts]
 
 
 @pytest.mark.training
-def test_optimize():
+def test_train_model_profile(args_fp):
+    experiment_name = "test_profile_experiment"
+    result = runner.invoke(
+        app,
+        [
+            "train-model",
+            f"--args-fp={args_fp}",
+            f"--experiment-name={experiment_name}",
+            "--test-run",
+            "--profile",
+        ],
+    )
+    assert result.exit_code == 0
+    run = mlflow.search_runs(experiment_names=[experiment_name], output_format="list")[0]
+    assert {"profile_wall_seconds", "profile_fit_wall_seconds"} <= set(run.data.metrics)
+    artifacts = mlflow.MlflowClient().list_artifacts(run.info.run_id, "profile")
+    assert "profile/fit.prof" in [artifact.path for artifact in artifacts]
+
+
+@pytest.mark.training
+def test_optimize(args_fp):
     study_name = "test_optimization"
     num_trials = 1
     result = runner.invoke(
@@ -74,7 +114,115 @@ def test_optimize():
     )
     assert result.exit_code == 0
 
-    delete_experiment(experiment_name=study_name)
+
+@pytest.mark.training
+def test_optimize_parallel(args_fp):
+    study_name = "test_parallel_optimization"
+    options = [
+        "optimize",
+        f"--args-fp={args_fp}",
+        f"--study-name={study_name}",
+        "--n-workers=2",
+    ]
+    result = runner.invoke(app, options + ["--num-trials=2"])
+    assert result.exit_code == 0
+    # Resumed study runs only the missing trials
+    result = runner.invoke(app, options + ["--num-trials=3", "--resume"])
+    assert result.exit_code == 0
+    study = optuna.load_study(study_name=study_name, storage=main._study_storage(study_name))
+    assert len(study.trials) == 3
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        ["train-model", "--validation=kfold"],
+        ["optimize", "--validation=kfold"],
+        ["optimize", "--n-workers=0"],
+    ],
+)
+def test_invalid_options(options, monkeypatch):
+    # Rejected before the data is read
+    monkeypatch.setattr(data, "load_preprocessed", None)
+    result = runner.invoke(app, options)
+    assert isinstance(result.exception, ValueError)
+
+
+@pytest.fixture()
+def artifacts_dir(trained, tmp_path, monkeypatch):
+    joblib.dump(trained["model"], Path(tmp_path, "model.pkl"))
+    inference.FlatForest.from_model(trained["model"]).save(Path(tmp_path, "forest"))
+    utils.save_dict(vars(trained["args"]), Path(tmp_path, "args.json"))
+    utils.save_dict(trained["performance"], Path(tmp_path, "performance.json"))
+    monkeypatch.setattr("runsor.artifacts._artifacts_dir", lambda run_id: tmp_path)
+    main.ARTIFACT_CACHE.clear()
+    yield tmp_path
+    main.ARTIFACT_CACHE.clear()
+
+
+def test_load_artifacts_cache(artifacts_dir):
+    artifacts = main.load_artifacts("run")
+    assert main.load_artifacts("run") is artifacts
+    assert main.ARTIFACT_CACHE.info()["hits"] == 1
+    assert main.load_artifacts("run", use_cache=False) is not artifacts
+
+
+def test_load_artifacts_cache_invalidation(artifacts_dir):
+    artifacts = main.load_artifacts("run")
+    filepath = Path(artifacts_dir, "performance.json")
+    utils.save_dict({"rmse": 1.0}, filepath)
+    os.utime(filepath, ns=(0, 0))
+    reloaded = main.load_artifacts("run")
+    assert reloaded is not artifacts
+    assert reloaded["performance"] == {"rmse": 1.0}
+    # Stale entry is a miss, the reloaded one is hit afterwards
+    assert main.ARTIFACT_CACHE.info()["hits"] == 0
+    assert main.ARTIFACT_CACHE.info()["misses"] == 2
+    assert main.load_artifacts("run") is reloaded
+    assert main.ARTIFACT_CACHE.info()["hits"] == 1
+
+
+def test_load_artifacts_flat(artifacts_dir):
+    artifacts = main.load_artifacts("run", model_format="flat")
+    assert isinstance(artifacts["model"], inference.FlatForest)
+    pickled = main.load_artifacts("run")
+    X = np.linspace(0, 3000, 14).reshape(2, 7)
+    assert np.array_equal(artifacts["model"].predict(X), pickled["model"].predict(X))
+    with pytest.raises(ValueError):
+        main.load_artifacts("run", model_format="onnx")
+
+
+def test_bundle_run(artifacts_dir, df, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SERVING_BUNDLE", Path(tmp_path, "serving", "bundle.tar"))
+    monkeypatch.setattr(data, "load_preprocessed", lambda filepath: df.assign(Calories=500))
+    result = runner.invoke(app, ["bundle-run", "--run-id=run"])
+    assert result.exit_code == 0
+    bundle = load_bundle(config.SERVING_BUNDLE)
+    assert bundle["run_id"] == "run"
+    assert bundle["features"] == df.columns.tolist()
+
+
+@pytest.mark.parametrize("output, n_workers", [("scores.csv", 1), ("scores.parquet", 2)])
+def test_predict_file(artifacts_dir, tmp_path, output, n_workers):
+    raw = activity_log(250)
+    raw.to_csv(Path(tmp_path, "activities.csv"), index=False)
+    main.predict_file(
+        str(Path(tmp_path, "activities.csv")),
+        str(Path(tmp_path, output)),
+        run_id="run",
+        chunk_size=60,
+        n_workers=n_workers,
+    )
+    if output.endswith(".csv"):
+        scores = pd.read_csv(Path(tmp_path, output))
+    else:
+        scores = pd.read_parquet(Path(tmp_path, output))
+    # Raw runs are preprocessed, so incomplete ones are dropped
+    expected = data.preprocess(raw)
+    assert len(scores) == len(expected)
+    artifacts = main.load_artifacts("run")
+    predictions = predict.predict(expected, artifacts, shape="columns", use_cache=False)
+    assert scores["Predicted Calories"].tolist() == predictions["predicted_calories"]
 
 
 def test_load_artifacts():
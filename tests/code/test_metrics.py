@@ -0,0 +1,24 @@
+from backend import metrics
+
+
+def test_histogram():
+    histogram = metrics.Histogram("latency_seconds", "Latency", ("stage",), buckets=[0.1, 1.0])
+    for value in [0.05, 0.5, 5.0]:
+        histogram.observe(value, stage="predict")
+    lines = histogram.collect()
+    assert 'latency_seconds_bucket{stage="predict",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="predict",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="predict",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="predict"} 3' in lines
+    assert "# TYPE latency_seconds histogram" in lines
+
+
+def test_counter():
+    counter = metrics.Counter("requests_total", "Requests", ("route",))
+    counter.inc(route="/predict")
+    counter.inc(2, route="/predict")
+    assert 'requests_total{route="/predict"} 3' in counter.collect()
+
+
+def test_labels_escaping():
+    assert metrics._labels(("run_id",), ('a"b\\c',)) == '{run_id="a\\"b\\\\c"}'
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from runsor import predict
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(42)
+    n = 50
+    df = pd.DataFrame(
+        {
+            "Distance": np.round(rng.uniform(2, 15, n), 2),
+            "Calories": rng.integers(150, 1000, n),
+            "Time": rng.integers(900, 5000, n),
+            "Avg HR": rng.integers(120, 180, n),
+            "Elev Gain": rng.integers(0, 500, n).astype(float),
+        }
+    )
+    return df
+
+
+@pytest.fixture(scope="module")
+def artifacts(df):
+    model = RandomForestRegressor(n_estimators=10, random_state=42)
+    model.fit(df.drop("Calories", axis=1).values, df["Calories"])
+    return {"model": model}
+
+
+def test_predict_rows(df, artifacts):
+    predictions = predict.predict(df, artifacts)
+    features = df.drop("Calories", axis=1)
+    calories = artifacts["model"].predict(features.values)
+    # Same response as building it row by row
+    expected = [
+        {"input_data": features.iloc[i].values.tolist(), "predicted_calories": int(calories[i])}
+        for i in range(len(calories))
+    ]
+    assert predictions == expected
+    assert type(predictions[0]["predicted_calories"]) == int
+
+
+def test_predict_columns(df, artifacts):
+    predictions = predict.predict(df, artifacts, shape="columns")
+    rows = predict.predict(df, artifacts)
+    assert predictions == {"predicted_calories": [row["predicted_calories"] for row in rows]}
+
+
+def test_predict_invalid_shape(df, artifacts):
+    with pytest.raises(ValueError):
+        predict.predict(df, artifacts, shape="table")
+
+
+def test_predict_flat_engine(df, artifacts):
+    assert predict.predict(df, artifacts, engine="flat") == predict.predict(df, artifacts)
+
+
+def test_predict_invalid_engine(df, artifacts):
+    with pytest.raises(ValueError):
+        predict.predict(df, artifacts, engine="onnx")
+
+
+def test_predict_cache(df, artifacts):
+    df = df.iloc[:10]
+    predict.PREDICTION_CACHE.clear()
+    cached_artifacts = {**artifacts, "run_id": "run"}
+    predictions = predict.predict(df, cached_artifacts)
+    assert predict.PREDICTION_CACHE.info()["misses"] == len(df)
+    assert predict.predict(df, cached_artifacts) == predictions
+    assert predict.PREDICTION_CACHE.info()["hits"] == len(df)
+    # Predictions of another run are not reused
+    predict.predict(df.iloc[:5], {**artifacts, "run_id": "other"})
+    assert predict.PREDICTION_CACHE.info()["misses"] == len(df) + 5
+    predict.PREDICTION_CACHE.clear()
+
+
+def test_predict_cache_scope(df, artifacts):
+    df = df.iloc[:10]
+    predict.PREDICTION_CACHE.clear()
+    loaded = {**artifacts, "run_id": "run", "signature": ((1, 10),)}
+    predict.predict(df, loaded)
+    # Artifacts of the same run reloaded from changed files, or another engine, miss the cache
+    predict.predict(df, {**loaded, "signature": ((2, 10),)})
+    predict.predict(df, loaded, engine="flat")
+    assert predict.PREDICTION_CACHE.info()["hits"] == 0
+    predict.predict(df, loaded, engine="flat")
+    assert predict.PREDICTION_CACHE.info()["hits"] == len(df)
+    predict.PREDICTION_CACHE.clear()
+
+
+def test_predict_cache_large_batch(df, artifacts):
+    predict.PREDICTION_CACHE.clear()
+    # Batches above config.PREDICTION_CACHE_MAX_ROWS bypass the cache
+    predict.predict(df, {**artifacts, "run_id": "run"})
+    assert predict.PREDICTION_CACHE.info()["misses"] == 0
+    assert len(predict.PREDICTION_CACHE) == 0
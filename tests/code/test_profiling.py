@@ -0,0 +1,57 @@
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from runsor import profiling
+
+
+def test_profiler():
+    with profiling.Profiler() as profiler:
+        for _ in range(2):
+            with profiling.phase("allocate"):
+                data = bytearray(4 * 2**20)
+                # Nested phases are part of the outer one
+                with profiling.phase("sleep"):
+                    time.sleep(0.01)
+        del data
+    assert profiling._active is None
+    assert list(profiler.phases) == ["allocate"]
+    stats = profiler.summary()["phases"]["allocate"]
+    assert stats["calls"] == 2
+    assert stats["wall_seconds"] >= 0.02
+    assert stats["peak_memory_mib"] >= 4
+    assert profiler.wall_seconds >= stats["wall_seconds"]
+    assert set(profiler.metrics()) == {
+        "profile_wall_seconds",
+        "profile_allocate_wall_seconds",
+        "profile_allocate_cpu_seconds",
+        "profile_allocate_peak_memory_mib",
+    }
+
+
+def test_profiler_disabled():
+    with profiling.Profiler(enabled=False) as profiler:
+        with profiling.phase("idle"):
+            pass
+    assert profiler.phases == {}
+    assert profiling._active is None
+
+
+def test_profiler_nested():
+    with profiling.Profiler():
+        with pytest.raises(RuntimeError):
+            with profiling.Profiler():
+                pass
+
+
+def test_save(tmp_path):
+    with profiling.Profiler() as profiler:
+        with profiling.phase("sort"):
+            sorted(range(10_000), reverse=True)
+    directory = profiler.save(Path(tmp_path, "profile"))
+    summary = json.loads(Path(directory, "summary.json").read_text())
+    assert summary["phases"]["sort"]["calls"] == 1
+    assert Path(directory, "sort.prof").exists()
+    assert "sorted" in Path(directory, "sort.txt").read_text()
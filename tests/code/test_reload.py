@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from backend.reload import ModelReloader
+
+
+@pytest.fixture()
+def model():
+    X = np.random.default_rng(42).uniform(size=(20, 3))
+    return RandomForestRegressor(n_estimators=2, random_state=42).fit(X, X[:, 0])
+
+
+def test_model_reloader(tmp_path, model):
+    run_id_fp = Path(tmp_path, "run_id.txt")
+    run_id_fp.write_text("old")
+    swapped = []
+    reloader = ModelReloader(
+        run_id_fp,
+        load_fn=lambda run_id: {"model": model, "run_id": run_id},
+        swap_fn=swapped.append,
+        run_id="old",
+    )
+    assert not reloader.check()
+    run_id_fp.write_text("new")
+    assert reloader.check()
+    assert reloader.run_id == "new"
+    assert [artifacts["run_id"] for artifacts in swapped] == ["new"]
+    assert not reloader.check()
+
+
+def test_model_reloader_failed_load(tmp_path, model):
+    run_id_fp = Path(tmp_path, "run_id.txt")
+    run_id_fp.write_text("broken")
+    calls = []
+
+    def load_fn(run_id):
+        calls.append(run_id)
+        raise FileNotFoundError(run_id)
+
+    reloader = ModelReloader(run_id_fp, load_fn=load_fn, swap_fn=None, run_id="old")
+    # Previous run keeps serving and the broken run is not loaded again
+    assert not reloader.check()
+    assert not reloader.check()
+    assert reloader.run_id == "old"
+    assert calls == ["broken"]
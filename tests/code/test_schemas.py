@@ -0,0 +1,22 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from backend.schemas import COLUMNS, FEATURES, RunningPack
+from runsor import data
+from tests.benchmarks.generator import activity_log
+
+
+def test_to_array():
+    run_pack = RunningPack.parse_obj(RunningPack.Config.schema_extra["example"])
+    # Same features as normalizing the JSON body
+    df = pd.json_normalize(json.loads(run_pack.json()), "runs")
+    assert np.array_equal(run_pack.to_array(), df.values)
+
+
+def test_columns():
+    # Run fields stand for the features the model is trained on, in the same order
+    df = data.preprocess(activity_log(20))
+    assert df.drop("Calories", axis=1).columns.tolist() == COLUMNS
+    assert len(COLUMNS) == len(FEATURES)
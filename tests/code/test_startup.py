@@ -0,0 +1,41 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from config import config
+
+# Packages the service and the Streamlit app must not import, they are only needed for training
+HEAVY_PACKAGES = {"mlflow", "optuna", "rich", "sklearn", "typer"}
+
+
+def import_in_subprocess(module):
+    code = (
+        "import json, sys, time; start = time.perf_counter(); "
+        f"import {module}; "
+        "print(json.dumps({'seconds': time.perf_counter() - start, 'modules': list(sys.modules)}))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=config.BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize(
+    "module, budget",
+    [
+        ("config.config", 0.5),
+        ("backend.api", 2.0),
+        ("frontend.app", 5.0),
+    ],
+)
+def test_import_budget(module, budget):
+    imported = import_in_subprocess(module)
+    packages = {name.split(".")[0] for name in imported["modules"]}
+    assert not packages & HEAVY_PACKAGES
+    assert imported["seconds"] < budget
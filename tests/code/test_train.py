@@ -0,0 +1,107 @@
+from argparse import Namespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from runsor import data, train
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(42)
+    n = 300
+    distance = np.round(rng.uniform(2, 15, n), 2)
+    heart_rate = rng.integers(120, 180, n)
+    df = pd.DataFrame(
+        {
+            "Distance": distance,
+            "Calories": (distance * 70 * heart_rate / 150).astype(int),
+            "Time": (distance * rng.integers(250, 400, n)).astype(int),
+            "Avg HR": heart_rate,
+            "Avg Run Cadence": rng.integers(150, 190, n),
+            "Avg Pace": rng.integers(250, 400, n),
+            "Elev Gain": rng.integers(0, 500, n).astype(float),
+            "Elev Loss": rng.integers(0, 500, n).astype(float),
+        }
+    )
+    return df
+
+
+@pytest.fixture()
+def args():
+    args = Namespace(
+        n_estimators=250, max_depth=None, min_samples_split=2, min_samples_leaf=1, max_features=1.0
+    )
+    return args
+
+
+@pytest.mark.parametrize(
+    "n_estimators, steps",
+    [(100, [100]), (250, [100, 200, 250]), (400, [100, 200, 300, 400]), (50, [50])],
+)
+def test_growth_steps(n_estimators, steps):
+    assert train.growth_steps(n_estimators) == steps
+
+
+@pytest.mark.training
+def test_train(df, args, monkeypatch):
+    logged = []
+    monkeypatch.setattr(
+        train.mlflow, "log_metrics", lambda metrics, step: logged.append((step, metrics))
+    )
+    artifacts = train.train(df=df, args=args, dataset=data.prepare_dataset(df))
+    model = artifacts["model"]
+    assert len(model.estimators_) == args.n_estimators
+    assert not model.warm_start
+    assert [step for step, _ in logged] == [100, 200, 250]
+    assert artifacts["performance"]["RMSE"] > 0
+
+
+@pytest.fixture(scope="module")
+def dataset(df):
+    return data.prepare_dataset(df)
+
+
+@pytest.fixture(scope="module")
+def forest(dataset):
+    model = RandomForestRegressor(n_estimators=30, oob_score=True, random_state=0)
+    model.fit(dataset.X_train, dataset.y_train)
+    return model
+
+
+def test_running_predictions(dataset, forest):
+    predictions = train.RunningPredictions(dataset.X_val)
+    predictions.update(forest.estimators_[:10])
+    predictions.update(forest.estimators_[10:])
+    assert predictions.n_trees == 30
+    assert np.array_equal(predictions.sums / predictions.counts, forest.predict(dataset.X_val))
+
+
+def test_running_predictions_oob(dataset, forest):
+    predictions = train.RunningPredictions(dataset.X_train, oob=True)
+    predictions.update(forest.estimators_[:10])
+    predictions.update(forest.estimators_[10:])
+    seen = predictions.counts > 0
+    oob = predictions.sums[seen] / predictions.counts[seen]
+    assert np.allclose(oob, forest.oob_prediction_[seen])
+    assert predictions.loss(dataset.y_train) == pytest.approx(
+        np.mean((dataset.y_train[seen] - oob) ** 2)
+    )
+
+
+@pytest.mark.training
+def test_train_oob(dataset, args, monkeypatch):
+    logged = []
+    monkeypatch.setattr(
+        train.mlflow, "log_metrics", lambda metrics, step: logged.append((step, metrics))
+    )
+    train.train(df=None, args=args, dataset=dataset, validation="oob")
+    # Out-of-bag error is larger than the error on samples the trees were fitted on
+    assert all(metrics["val_loss"] > metrics["train_loss"] for _, metrics in logged)
+
+
+def test_train_unknown_validation(dataset, args):
+    with pytest.raises(ValueError):
+        train.train(df=None, args=args, dataset=dataset, validation="kfold")
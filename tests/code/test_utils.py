@@ -28,3 +28,54 @@ def test_set_seed():
     utils.set_seeds()
     x = np.random.randn(1, 3)
     assert np.array_equal(a, x)
+
+
+def test_file_hash():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir, "data.csv")
+        filepath.write_text("Distance,Calories\n6.0,530\n")
+        digest = utils.file_hash(filepath, block_size=4)
+        assert digest == utils.file_hash(filepath)
+        filepath.write_text("Distance,Calories\n6.0,531\n")
+        assert digest != utils.file_hash(filepath)
+
+
+def test_lru_cache():
+    cache = utils.LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # "b" is the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.info() == {"hits": 2, "misses": 1, "hit_ratio": 2 / 3, "size": 2, "maxsize": 2}
+    cache.clear()
+    assert cache.info() == {"hits": 0, "misses": 0, "hit_ratio": 0.0, "size": 0, "maxsize": 2}
+
+
+def test_lru_cache_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now[0])
+    cache = utils.LRUCache(maxsize=2, ttl=10)
+    cache.put("a", 1)
+    now[0] += 5
+    assert cache.get("a") == 1
+    now[0] += 5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_valid():
+    cache = utils.LRUCache(maxsize=2)
+    cache.put("a", 1)
+    assert cache.get("a", valid=lambda value: value == 1) == 1
+    assert cache.get("a", valid=lambda value: value == 2) is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_cache_invalid_size():
+    with pytest.raises(ValueError):
+        utils.LRUCache(maxsize=0)
+    with pytest.raises(ValueError):
+        utils.LRUCache(ttl=0)
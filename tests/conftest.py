@@ -0,0 +1,22 @@
+from argparse import Namespace
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from config import config
+
+# Importing the config has no side effects, tests use the same setup as the entry points
+config.init()
+
+
+@pytest.fixture(scope="session")
+def trained():
+    """Small forest with its arguments and performance, the artifacts a training run logs."""
+    X = np.random.default_rng(42).uniform(0, 3000, size=(100, 7))
+    model = RandomForestRegressor(n_estimators=2, random_state=42).fit(X, X[:, 1] / 5)
+    return {
+        "args": Namespace(n_estimators=2),
+        "model": model,
+        "performance": {"RMSE": 1.0},
+    }